@@ -1,20 +1,29 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
 
 # إنشاء قاعدة البيانات
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'your_secret_key_here'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # إعدادات إضافية (مثل قاعدة بيانات مستقلة للاختبارات)
+    if config:
+        app.config.update(config)
+    
     # تهيئة قاعدة البيانات مع التطبيق
     db.init_app(app)
     
+    # تهيئة التخزين المؤقت للصفحات
+    from cache import init_cache
+    init_cache(app)
+    
     # إعداد مدير تسجيل الدخول
     login_manager.init_app(app)
     login_manager.login_view = 'login'
@@ -26,21 +35,44 @@ def create_app():
     from routes.book_routes import book_bp
     from routes.reservation_routes import reservation_bp
     from routes.admin_routes import admin_bp
+    from routes.circulation_routes import circulation_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(book_bp)
     app.register_blueprint(reservation_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(circulation_bp)
     
     # تسجيل معالجات الأخطاء
     register_error_handlers(app)
     
+    # تسجيل أوامر سطر الأوامر
+    from commands import register_commands
+    register_commands(app)
+    
     # إنشاء قاعدة البيانات وإضافة البيانات الافتراضية
     with app.app_context():
         from models import User, Category, Book, Resource, BorrowingRules
         from werkzeug.security import generate_password_hash
+        from search import init_book_search
+        from migrations import run_migrations
+        
+        # قيود المفاتيح الأجنبية معطلة افتراضياً في SQLite، فتفعل لكل اتصال جديد
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _enable_foreign_keys)
         
         db.create_all()
+        init_book_search(db)
+        run_migrations(db)
+        
+        # عداد الاستعلامات وكشف التحميل الكسول في القوالب (وضع التطوير والاختبار)
+        from query_counter import install_query_counter
+        install_query_counter(app, db)
+        
+        # فحص خطط الاستعلامات في وضع التطوير
+        if app.config.get('QUERY_PLAN_CHECK', app.debug):
+            from query_plan import install_scan_check
+            install_scan_check(app, db)
         
         # التحقق من وجود مستخدم المسؤول
         admin = User.query.filter_by(username='admin').first()
@@ -79,7 +111,10 @@ def create_app():
             for resource in resources:
                 db.session.add(resource)
             
-            # إضافة قواعد الاستعارة الافتراضية
+            db.session.commit()
+        
+        # إضافة قواعد الاستعارة الافتراضية (مرة واحدة عند الإعداد وليس أثناء الطلبات)
+        if not BorrowingRules.query.first():
             borrowing_rules = BorrowingRules(
                 max_days=7,
                 max_books=3,
@@ -97,6 +132,11 @@ def create_app():
     
     return app
 
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 def register_error_handlers(app):
     @app.errorhandler(404)
     def page_not_found(e):
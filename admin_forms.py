@@ -1,6 +1,9 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, IntegerField, SelectField, PasswordField, BooleanField
-from wtforms.validators import DataRequired, Length, Optional, NumberRange, Email
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, TextAreaField, IntegerField, SelectField, PasswordField, BooleanField, DateField, TimeField
+from wtforms.validators import DataRequired, Length, Optional, NumberRange, Email, ValidationError
+from school_calendar import CALENDAR_KINDS
+from timetable import WEEKDAY_NAMES, MAX_PERIOD_NUMBER
 
 class UserForm(FlaskForm):
     name = StringField('الاسم الكامل', validators=[DataRequired(message='يرجى إدخال الاسم الكامل'), Length(min=2, max=100, message='يجب أن يكون الاسم بين 2 و 100 حرف')])
@@ -16,6 +19,7 @@ class UserForm(FlaskForm):
         ('11', 'الصف الحادي عشر'),
         ('12', 'الصف الثاني عشر')
     ])
+    email = StringField('البريد الإلكتروني (للتنبيهات)', validators=[Optional(), Length(max=120, message='يجب أن لا يتجاوز البريد الإلكتروني 120 حرف')])
     password = PasswordField('كلمة المرور الجديدة (اترك فارغاً للإبقاء على كلمة المرور الحالية)')
 
 class BookForm(FlaskForm):
@@ -26,6 +30,11 @@ class BookForm(FlaskForm):
     description = TextAreaField('وصف الكتاب', validators=[Optional()])
     category_id = SelectField('التصنيف', coerce=int, validators=[DataRequired(message='يرجى اختيار تصنيف')])
     available = BooleanField('متاح للاستعارة', default=True)
+    copies_to_add = IntegerField('عدد النسخ المضافة', default=1, validators=[Optional(), NumberRange(min=0, max=500, message='يجب أن يكون عدد النسخ بين 0 و 500')])
+
+class CatalogImportForm(FlaskForm):
+    file = FileField('ملف الفهرس', validators=[FileRequired(message='يرجى اختيار ملف'), FileAllowed(['csv', 'xlsx', 'mrc', 'marc'], message='الملفات المدعومة: CSV و Excel و MARC')])
+    create_categories = BooleanField('إنشاء التصنيفات غير الموجودة', default=False)
 
 class CategoryForm(FlaskForm):
     name = StringField('اسم التصنيف', validators=[DataRequired(message='يرجى إدخال اسم التصنيف'), Length(min=2, max=100, message='يجب أن يكون اسم التصنيف بين 2 و 100 حرف')])
@@ -35,3 +44,24 @@ class BorrowingRulesForm(FlaskForm):
     max_days = IntegerField('الحد الأقصى لأيام الاستعارة', validators=[DataRequired(message='يرجى إدخال الحد الأقصى لأيام الاستعارة'), NumberRange(min=1, max=30, message='يجب أن يكون الحد الأقصى بين 1 و 30 يوم')])
     max_books = IntegerField('الحد الأقصى لعدد الكتب المستعارة للشخص الواحد', validators=[DataRequired(message='يرجى إدخال الحد الأقصى لعدد الكتب'), NumberRange(min=1, max=10, message='يجب أن يكون الحد الأقصى بين 1 و 10 كتب')])
     rules_text = TextAreaField('نص شروط الاستعارة', validators=[DataRequired(message='يرجى إدخال نص شروط الاستعارة')])
+
+class SchoolCalendarForm(FlaskForm):
+    name = StringField('الاسم', validators=[DataRequired(message='يرجى إدخال الاسم'), Length(max=100, message='يجب أن لا يتجاوز الاسم 100 حرف')])
+    kind = SelectField('النوع', choices=list(CALENDAR_KINDS.items()), validators=[DataRequired(message='يرجى اختيار النوع')])
+    start_date = DateField('من تاريخ', validators=[DataRequired(message='يرجى اختيار تاريخ البداية')])
+    end_date = DateField('إلى تاريخ', validators=[DataRequired(message='يرجى اختيار تاريخ النهاية')])
+    
+    def validate_end_date(self, field):
+        if self.start_date.data and field.data < self.start_date.data:
+            raise ValidationError('يجب أن يكون تاريخ النهاية بعد تاريخ البداية')
+
+class PeriodForm(FlaskForm):
+    number = IntegerField('رقم الحصة', validators=[DataRequired(message='يرجى إدخال رقم الحصة'), NumberRange(min=1, max=MAX_PERIOD_NUMBER, message=f'يجب أن يكون رقم الحصة بين 1 و {MAX_PERIOD_NUMBER}')])
+    name = StringField('الاسم (اختياري)', validators=[Optional(), Length(max=50, message='يجب أن لا يتجاوز الاسم 50 حرف')])
+    weekday = SelectField('اليوم', choices=[('', 'كل الأيام')] + [(str(day), name) for day, name in WEEKDAY_NAMES.items()])
+    start_time = TimeField('وقت البداية', validators=[DataRequired(message='يرجى إدخال وقت البداية')])
+    end_time = TimeField('وقت النهاية', validators=[DataRequired(message='يرجى إدخال وقت النهاية')])
+    
+    def validate_end_time(self, field):
+        if self.start_time.data and field.data <= self.start_time.data:
+            raise ValidationError('يجب أن يكون وقت النهاية بعد وقت البداية')
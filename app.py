@@ -3,6 +3,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timedelta
+from search import init_book_search, apply_book_search, register_search_keys
+from pagination import keyset_paginate
 import os
 
 # إنشاء تطبيق Flask
@@ -49,6 +51,9 @@ class Book(db.Model):
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=True)
     isbn = db.Column(db.String(20), nullable=True)
+    # مفاتيح البحث المطبعة (تحسب عند الحفظ في search.register_search_keys)
+    title_search = db.Column(db.String(200), nullable=True, index=True)
+    author_search = db.Column(db.String(100), nullable=True, index=True)
     publication_year = db.Column(db.Integer, nullable=True)
     description = db.Column(db.Text, nullable=True)
     available = db.Column(db.Boolean, default=True)
@@ -60,6 +65,8 @@ class Book(db.Model):
     reservations = db.relationship('BookReservation', backref='book', lazy=True)
     added_by_user = db.relationship('User', foreign_keys=[added_by])
 
+register_search_keys(Book)
+
 # جدول حجوزات الكتب
 class BookReservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -131,6 +138,7 @@ def teacher_required(f):
 def create_tables():
     with app.app_context():
         db.create_all()
+        init_book_search(db)
         
         # التحقق من وجود مستخدم المسؤول
         admin = User.query.filter_by(username='admin').first()
@@ -359,32 +367,35 @@ def register():
 # عرض الكتب
 @app.route('/books')
 def books():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     query = request.args.get('query', '')
     category_id = request.args.get('category', '')
-    sort = request.args.get('sort', 'title')
+    sort = request.args.get('sort') or ('relevance' if query else 'title')
     
     # بناء الاستعلام
     books_query = Book.query
+    rank = None
     
-    # تطبيق البحث إذا وجد
+    # تطبيق البحث إذا وجد (فهرس البحث النصي الكامل)
     if query:
-        books_query = books_query.filter(Book.title.contains(query) | Book.author.contains(query))
+        books_query, rank = apply_book_search(db, books_query, Book, query)
     
     # تطبيق فلتر التصنيف إذا وجد
     if category_id and category_id.isdigit():
         books_query = books_query.filter_by(category_id=int(category_id))
     
-    # تطبيق الترتيب
-    if sort == 'title':
-        books_query = books_query.order_by(Book.title)
+    # تطبيق الترتيب (المعرف في النهاية لضمان ترتيب ثابت بين الصفحات)
+    if sort == 'relevance' and rank is not None:
+        order = [(rank, False), (Book.id, False)]
     elif sort == 'author':
-        books_query = books_query.order_by(Book.author)
+        order = [(Book.author, False), (Book.id, False)]
     elif sort == 'newest':
-        books_query = books_query.order_by(Book.created_at.desc())
+        order = [(Book.created_at, True), (Book.id, True)]
+    else:
+        order = [(Book.title, False), (Book.id, False)]
     
     # تنفيذ الاستعلام مع الصفحات
-    books = books_query.paginate(page=page, per_page=12)
+    books = keyset_paginate(books_query, order, cursor=cursor, per_page=12)
     categories = Category.query.all()
     
     return render_template('books.html', 
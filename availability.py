@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+from sqlalchemy import select
+from __init__ import db
+from models import Resource, ResourceReservation
+from school_calendar import open_days
+from timetable import get_timetable
+
+# جدول إشغال المختبرات وغرف المصادر لفترة كاملة (أسبوع أو شهر) في استعلام واحد
+# على فهرس (التاريخ، المورد، الحصة). الإشغال لكل مورد ويوم رقم واحد (bitmap):
+# البت رقم (الحصة - 1) يساوي 1 إذا كانت الحصة محجوزة
+
+# أطول فترة يمكن طلبها مرة واحدة
+MAX_RANGE_DAYS = 62
+
+def week_range(day):
+    # أسبوع الدراسة يبدأ يوم الأحد
+    start = day - timedelta(days=(day.weekday() + 1) % 7)
+    return start, start + timedelta(days=6)
+
+def month_range(day):
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+def is_reserved(mask, period):
+    return bool(mask & (1 << (period - 1)))
+
+# يرجع {معرف المورد: {التاريخ: bitmap}} لكل الحجوزات، و bitmap مماثلاً لحجوزات المستخدم
+def occupancy(start, end, resource_ids=None, user_id=None):
+    statement = select(ResourceReservation.resource_id, ResourceReservation.reservation_date,
+                       ResourceReservation.period, ResourceReservation.user_id) \
+        .where(ResourceReservation.reservation_date >= start, ResourceReservation.reservation_date <= end)
+    if resource_ids:
+        statement = statement.where(ResourceReservation.resource_id.in_(resource_ids))
+
+    taken = {}
+    mine = {}
+    for resource_id, day, period, owner_id in db.session.execute(statement):
+        bit = 1 << (period - 1)
+        days = taken.setdefault(resource_id, {})
+        days[day] = days.get(day, 0) | bit
+        if user_id is not None and owner_id == user_id:
+            days = mine.setdefault(resource_id, {})
+            days[day] = days.get(day, 0) | bit
+    return taken, mine
+
+def availability_grid(start, end, resource_ids=None, user_id=None):
+    if end < start:
+        start, end = end, start
+    end = min(end, start + timedelta(days=MAX_RANGE_DAYS - 1))
+
+    resources = Resource.query.order_by(Resource.id)
+    if resource_ids:
+        resources = resources.filter(Resource.id.in_(resource_ids))
+    resources = resources.all()
+
+    # أعمدة الحصص وقناع الحصص الموجودة في كل يوم من الجدول الزمني المخزن
+    timetable = get_timetable()
+    days = open_days(start, end)
+    taken, mine = occupancy(start, end, resource_ids, user_id)
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'periods': timetable.columns,
+        'open': {day: timetable.mask_for(day) for day in days},
+        'resources': resources,
+        'taken': taken,
+        'mine': mine,
+    }
+
+# صيغة JSON: التواريخ نصوص، والإشغال أرقام bitmap لكل يوم
+def grid_to_json(grid):
+    def masks(source, resource_id):
+        return {day.isoformat(): source.get(resource_id, {}).get(day, 0) for day in grid['days']}
+
+    return {
+        'start': grid['start'].isoformat(),
+        'end': grid['end'].isoformat(),
+        'days': [day.isoformat() for day in grid['days']],
+        'periods': [slot.to_json() for slot in grid['periods']],
+        'open': {day.isoformat(): mask for day, mask in grid['open'].items()},
+        'resources': [{
+            'id': resource.id,
+            'name': resource.name,
+            'type': resource.type,
+            'taken': masks(grid['taken'], resource.id),
+            'mine': masks(grid['mine'], resource.id),
+        } for resource in grid['resources']],
+    }
+
+def parse_day(value, default=None):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default or date.today()
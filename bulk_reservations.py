@@ -0,0 +1,69 @@
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import joinedload
+from __init__ import db
+from models import BookReservation
+from inventory import release_copies
+from reservation_engine import compute_due_date
+from reservation_stats import record_transitions
+from rules_cache import get_borrowing_rules
+from outbox import queue_notification
+
+# الإجراءات الجماعية على طابور الحجوزات: كل إجراء تحديث واحد على المعرفات المطلوبة
+# مشروط بالحالة المسموحة، في معاملة واحدة، مع نتيجة لكل معرف
+# (ok أو not_found أو invalid_status)
+
+# الحالات التي يسمح منها بكل إجراء والحالة الناتجة
+BULK_ACTIONS = {
+    'approve': (('pending',), 'approved'),
+    'reject': (('pending', 'approved'), 'rejected'),
+    'return': (('approved',), 'returned'),
+}
+
+NOTIFICATION_KINDS = {
+    'approve': 'approved',
+    'reject': 'rejected',
+    'return': 'returned',
+}
+
+def bulk_transition(action, ids):
+    allowed, target = BULK_ACTIONS[action]
+    table = BookReservation.__table__
+    ids = sorted(set(ids))
+    now = datetime.now()
+
+    values = {'status': target}
+    if action == 'return':
+        values['return_date'] = now
+
+    changed = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(ids), table.c.status.in_(allowed))
+        .values(**values)
+        .returning(table.c.id, table.c.book_id, table.c.copy_id, table.c.reservation_date)
+    ).all()
+
+    if action == 'approve' and changed:
+        max_days = get_borrowing_rules().max_days
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('reservation_id')).values(due_date=bindparam('due')),
+            [{'reservation_id': row.id, 'due': compute_due_date(row.reservation_date, max_days)} for row in changed]
+        )
+    elif changed:
+        release_copies([(row.book_id, row.copy_id) for row in changed])
+
+    done = {row.id for row in changed}
+    if done:
+        reservations = BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book)) \
+            .filter(BookReservation.id.in_(done)).populate_existing().all()
+        record_transitions(reservations, target)
+        for reservation in reservations:
+            queue_notification(reservation.user, NOTIFICATION_KINDS[action], title=reservation.book.title,
+                               due_date=reservation.due_date)
+
+    db.session.commit()
+
+    existing = set(db.session.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars()) if len(done) < len(ids) else done
+    return {reservation_id: 'ok' if reservation_id in done else
+            'invalid_status' if reservation_id in existing else 'not_found'
+            for reservation_id in ids}
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+# تخزين مؤقت لصفحات الزوار غير المسجلين (قراءة عبر الذاكرة المؤقتة)
+# المفتاح: مجموعة الصفحات + رقم جيلها + المسار + نص الاستعلام
+# الإبطال يتم برفع رقم جيل المجموعة، فتتجاهل كل المفاتيح القديمة دون البحث عنها
+
+# ذاكرة داخل العملية: LRU بحد أقصى لعدد العناصر مع مدة صلاحية لكل عنصر
+class MemoryCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+# خادم Redis (أو متوافق معه) مشترك بين العمليات، اختياري
+class RedisCache:
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get('page_cache:' + key)
+
+    def set(self, key, value, ttl):
+        self._client.set('page_cache:' + key, value, ex=max(int(ttl), 1))
+
+    def generation(self, namespace):
+        return int(self._client.get('page_cache:gen:' + namespace) or 0)
+
+    def bump(self, namespace):
+        self._client.incr('page_cache:gen:' + namespace)
+
+def init_cache(app):
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+    if backend == 'redis':
+        cache = RedisCache(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    else:
+        cache = MemoryCache(app.config.get('CACHE_MAX_ENTRIES', 256))
+    app.extensions['page_cache'] = cache
+    return cache
+
+def get_cache():
+    return current_app.extensions['page_cache']
+
+def invalidate_pages(namespace):
+    get_cache().bump(namespace)
+
+def _cacheable_request():
+    if request.method != 'GET' or current_user.is_authenticated:
+        return False
+    # الصفحة تعرض رسائل flash المعلقة فلا تخزن
+    return '_flashes' not in session
+
+def cached_page(namespace, ttl=None):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not _cacheable_request():
+                return f(*args, **kwargs)
+
+            cache = get_cache()
+            key = '{}:{}:{}?{}'.format(namespace, cache.generation(namespace), request.path,
+                                       '&'.join(sorted(request.query_string.decode('utf-8').split('&'))))
+            body = cache.get(key)
+            if body is not None:
+                return make_response(body)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and response.mimetype == 'text/html':
+                cache.set(key, response.get_data(), ttl or current_app.config.get('CACHE_DEFAULT_TTL', 60))
+            return response
+        return decorated_function
+    return decorator
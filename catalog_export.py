@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select
+from __init__ import db
+from models import User, Book, Category, BookReservation, Resource, ResourceReservation
+from timetable import get_timetable
+
+# تصدير الفهرس وسجل الحجوزات بذاكرة ثابتة: الاستعلام يقرأ بمؤشر من جهة الخادم
+# (yield_per) على دفعات، وكل دفعة تكتب إلى المخرج مباشرة (ملف أو استجابة HTTP مجزأة)
+# دون تحميل النتائج كاملة في الذاكرة
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = ('csv', 'jsonl', 'xlsx')
+
+def _books(filters):
+    statement = select(Book.id, Book.title, Book.author, Book.isbn, Book.publication_year,
+                       Category.name.label('category'), Book.copies_count, Book.available_copies,
+                       Book.created_at) \
+        .join(Category, Category.id == Book.category_id)
+    if filters.get('category_id'):
+        statement = statement.where(Book.category_id == filters['category_id'])
+    if filters.get('start'):
+        statement = statement.where(Book.created_at >= datetime.combine(filters['start'], datetime.min.time()))
+    if filters.get('end'):
+        statement = statement.where(Book.created_at < _day_after(filters['end']))
+    return statement.order_by(Book.id)
+
+def _reservations(filters):
+    statement = select(BookReservation.id, User.username, User.name, User.role, User.grade,
+                       Book.title, Book.isbn, Category.name.label('category'),
+                       BookReservation.reservation_date, BookReservation.return_date,
+                       BookReservation.status, BookReservation.created_at) \
+        .join(User, User.id == BookReservation.user_id) \
+        .join(Book, Book.id == BookReservation.book_id) \
+        .join(Category, Category.id == Book.category_id)
+    if filters.get('status'):
+        statement = statement.where(BookReservation.status == filters['status'])
+    if filters.get('category_id'):
+        statement = statement.where(Book.category_id == filters['category_id'])
+    if filters.get('start'):
+        statement = statement.where(BookReservation.reservation_date >= datetime.combine(filters['start'], datetime.min.time()))
+    if filters.get('end'):
+        statement = statement.where(BookReservation.reservation_date < _day_after(filters['end']))
+    return statement.order_by(BookReservation.id)
+
+def _resource_reservations(filters):
+    statement = select(ResourceReservation.id, Resource.name.label('resource'), Resource.type,
+                       User.username, User.name, ResourceReservation.reservation_date,
+                       ResourceReservation.period, ResourceReservation.created_at) \
+        .join(Resource, Resource.id == ResourceReservation.resource_id) \
+        .join(User, User.id == ResourceReservation.user_id)
+    if filters.get('start'):
+        statement = statement.where(ResourceReservation.reservation_date >= filters['start'])
+    if filters.get('end'):
+        statement = statement.where(ResourceReservation.reservation_date <= filters['end'])
+    return statement.order_by(ResourceReservation.id)
+
+# اسم الحصة ووقتها من الجدول الزمني المخزن (حسب يوم الحجز) دون استعلام إضافي
+def _with_period_times(columns, rows):
+    timetable = get_timetable()
+    day_index = columns.index('reservation_date')
+    period_index = columns.index('period')
+
+    def extend(row):
+        slot = timetable.slot(row[day_index], row[period_index])
+        return tuple(row) + ((slot.name, slot.start_time, slot.end_time) if slot else (None, None, None))
+
+    return columns + ['period_name', 'period_start', 'period_end'], (extend(row) for row in rows)
+
+# مجموعات البيانات القابلة للتصدير
+EXPORTS = {
+    'books': _books,
+    'reservations': _reservations,
+    'resource_reservations': _resource_reservations,
+}
+
+# أعمدة محسوبة تضاف إلى صفوف بعض المجموعات أثناء القراءة
+EXPORT_EXTENSIONS = {
+    'resource_reservations': _with_period_times,
+}
+
+# الأعمدة الزمنية تحفظ بالوقت، فنهاية الفترة تشمل اليوم الأخير كاملاً
+def _day_after(day):
+    return datetime.combine(day, datetime.min.time()) + timedelta(days=1)
+
+def _serialize(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+# تنفيذ التصدير: يرجع أسماء الأعمدة ومولداً للصفوف يقرأ على دفعات
+def export_rows(dataset, filters=None):
+    statement = EXPORTS[dataset](filters or {})
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    columns, rows = list(result.keys()), (row for partition in result.partitions() for row in partition)
+    if dataset in EXPORT_EXTENSIONS:
+        columns, rows = EXPORT_EXTENSIONS[dataset](columns, rows)
+    return columns, rows
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# CSV مع علامة BOM حتى يفتحه Excel بترميز UTF-8 (النصوص العربية)
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for chunk in _chunks(rows):
+        writer.writerows([_serialize(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_jsonl(columns, rows):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps(dict(zip(columns, map(_serialize, row))), ensure_ascii=False) + '\n'
+                      for row in chunk)
+
+# يتطلب مكتبة openpyxl؛ وضع الكتابة فقط يكتب الصفوف إلى ملف مؤقت بدلاً من الذاكرة
+def write_excel(columns, rows, stream):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(stream)
+
+# قراءة مرشحات التصدير من معاملات الطلب أو خيارات سطر الأوامر (القيم غير الصالحة تتجاهل)
+def parse_export_filters(args):
+    filters = {}
+    for name in ('start', 'end'):
+        try:
+            filters[name] = datetime.strptime(args.get(name) or '', '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    if args.get('status'):
+        filters['status'] = args.get('status')
+    try:
+        filters['category_id'] = int(args.get('category_id') or '')
+    except ValueError:
+        pass
+    return filters
+
+def export_filename(dataset, export_format):
+    return '{}-{}.{}'.format(dataset, date.today().isoformat(), export_format)
@@ -0,0 +1,244 @@
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from __init__ import db
+from models import Book, BookCopy, Category
+from admin_forms import BookForm
+from counters import adjust_category_counts
+from inventory import make_barcode
+from search import SEARCH_KEYS, normalize_text
+
+# استيراد الفهرس دفعة واحدة من ملف CSV أو Excel أو MARC
+# الملف يقرأ صفاً بصف، وكل صف يتحقق منه بقواعد BookForm نفسها، والتصنيفات تحل بالاسم
+# من قاموس في الذاكرة، والتكرار يكشف بالرقم المعياري، ثم تدرج الكتب ونسخها على دفعات
+# كبيرة (معاملة لكل دفعة) بدلاً من معاملة لكل كتاب
+
+IMPORT_BATCH_SIZE = 1000
+
+# أسماء الأعمدة المقبولة في الملف (عربية أو إنجليزية) وحقل النموذج المقابل
+COLUMN_ALIASES = {
+    'title': 'title', 'العنوان': 'title', 'عنوان الكتاب': 'title',
+    'author': 'author', 'المؤلف': 'author',
+    'isbn': 'isbn', 'الرقم المعياري': 'isbn',
+    'publication_year': 'publication_year', 'year': 'publication_year', 'سنة النشر': 'publication_year',
+    'description': 'description', 'الوصف': 'description',
+    'category': 'category', 'التصنيف': 'category',
+    'copies': 'copies_to_add', 'copies_to_add': 'copies_to_add', 'عدد النسخ': 'copies_to_add',
+}
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.copies = 0
+        self.errors = []  # (رقم الصف، الرسالة)
+
+    @property
+    def skipped(self):
+        return self.rows - self.inserted
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    def write_errors(self, stream):
+        writer = csv.writer(stream)
+        writer.writerow(['row', 'error'])
+        writer.writerows(self.errors)
+
+def normalize_isbn(value):
+    return ''.join(ch for ch in (value or '') if ch.isalnum()).upper()
+
+def _clean(value):
+    if value is None:
+        return ''
+    # الأرقام في Excel تقرأ أعداداً عشرية (1999.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _map_columns(header):
+    return [COLUMN_ALIASES.get(_clean(name).lower()) for name in header]
+
+def read_csv(stream):
+    reader = csv.reader(stream)
+    columns = _map_columns(next(reader, []))
+    for values in reader:
+        yield {name: _clean(value) for name, value in zip(columns, values) if name}
+
+# يتطلب مكتبة openpyxl (وضع القراءة فقط لا يحمل الملف كاملاً في الذاكرة)
+def read_excel(stream):
+    from openpyxl import load_workbook
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = _map_columns(next(rows, ()))
+        for values in rows:
+            yield {name: _clean(value) for name, value in zip(columns, values) if name}
+    finally:
+        workbook.close()
+
+def _marc_value(record, tag, *codes):
+    for field in record.get_fields(tag):
+        parts = [value for code in codes for value in field.get_subfields(code)]
+        if parts:
+            return ' '.join(part.strip(' /:;,.') for part in parts)
+    return ''
+
+# يتطلب مكتبة pymarc: العنوان 245، المؤلف 100، الرقم المعياري 020، السنة 260/264،
+# الوصف 520، والتصنيف أول موضوع في 650
+def read_marc(stream):
+    from pymarc import MARCReader
+    for record in MARCReader(stream, to_unicode=True, force_utf8=True):
+        if record is None:
+            yield {}
+            continue
+        year = _marc_value(record, '260', 'c') or _marc_value(record, '264', 'c')
+        yield {
+            'title': _marc_value(record, '245', 'a', 'b'),
+            'author': _marc_value(record, '100', 'a'),
+            'isbn': _marc_value(record, '020', 'a').split(' ')[0],
+            'publication_year': ''.join(ch for ch in year if ch.isdigit())[:4],
+            'description': _marc_value(record, '520', 'a'),
+            'category': _marc_value(record, '650', 'a'),
+        }
+
+READERS = {
+    'csv': read_csv,
+    'xlsx': read_excel,
+    'mrc': read_marc,
+    'marc': read_marc,
+}
+
+def open_reader(stream, filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension not in READERS:
+        raise ValueError('نوع الملف غير مدعوم: {}'.format(extension))
+    if extension == 'csv':
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    return READERS[extension](stream)
+
+def _category_map():
+    return {normalize_text(name): category_id
+            for category_id, name in db.session.execute(select(Category.id, Category.name))}
+
+def _existing_isbns():
+    return {normalize_isbn(isbn) for isbn in db.session.execute(select(Book.isbn).where(Book.isbn.isnot(None))).scalars()}
+
+# التحقق من صف بقواعد BookForm (بدون CSRF)، يرجع (بيانات النموذج، الأخطاء)
+def validate_row(row, categories):
+    category_id = categories.get(normalize_text(row.get('category')))
+    formdata = MultiDict({key: value for key, value in row.items() if key != 'category'})
+    formdata['category_id'] = str(category_id or '')
+    if not row.get('copies_to_add'):
+        formdata['copies_to_add'] = '1'
+
+    form = BookForm(formdata=formdata, meta={'csrf': False})
+    form.category_id.choices = [(category_id, '')] if category_id else []
+
+    errors = []
+    if category_id is None:
+        errors.append('تصنيف غير معروف: {}'.format(row.get('category') or '-'))
+    if not form.validate():
+        errors.extend(error for field, messages in form.errors.items()
+                      if field != 'category_id' for error in messages)
+    return form, errors
+
+# إدراج دفعة من الكتب ونسخها: إدراج واحد متعدد الصفوف للكتب (مع إرجاع المعرفات)
+# وآخر للنسخ، ثم تعديل عدادات التصنيفات مرة لكل تصنيف
+def _insert_batch(batch):
+    book_table = Book.__table__
+    ids = db.session.execute(
+        insert(book_table).returning(book_table.c.id, sort_by_parameter_order=True),
+        [values for values, copies in batch]
+    ).scalars().all()
+
+    copy_rows = []
+    per_category = {}
+    now = datetime.utcnow()
+    for book_id, (values, copies) in zip(ids, batch):
+        for number in range(1, copies + 1):
+            copy_rows.append({'book_id': book_id, 'barcode': make_barcode(book_id, number),
+                              'condition': 'good', 'status': 'available', 'created_at': now})
+        books, available = per_category.get(values['category_id'], (0, 0))
+        per_category[values['category_id']] = (books + 1, available + int(values['available']))
+
+    if copy_rows:
+        db.session.execute(insert(BookCopy.__table__), copy_rows)
+
+    # الإدراج المباشر لا يمر بأحداث النموذج، فتعدل العدادات هنا
+    connection = db.session.connection()
+    for category_id, (books, available) in per_category.items():
+        adjust_category_counts(connection, Category.__table__, category_id, books, available)
+
+    db.session.commit()
+    return len(copy_rows)
+
+def _create_category(name, categories):
+    category = Category(name=name)
+    db.session.add(category)
+    db.session.flush()
+    categories[normalize_text(name)] = category.id
+
+# رقم الصف في تقرير الأخطاء يبدأ من 1 لأول سجل بعد صف العناوين
+def import_catalog(rows, added_by, create_categories=False, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    result = ImportResult()
+    categories = _category_map()
+    seen_isbns = _existing_isbns()
+    batch = []
+    now = datetime.utcnow()
+
+    for row_number, row in enumerate(rows, start=1):
+        result.rows += 1
+        name = row.get('category')
+        if create_categories and name and normalize_text(name) not in categories:
+            _create_category(name, categories)
+
+        form, errors = validate_row(row, categories)
+
+        isbn = normalize_isbn(form.isbn.data)
+        if isbn and isbn in seen_isbns:
+            errors.append('الرقم المعياري مكرر: {}'.format(form.isbn.data))
+
+        if errors:
+            for error in errors:
+                result.add_error(row_number, error)
+            continue
+
+        if isbn:
+            seen_isbns.add(isbn)
+        copies = form.copies_to_add.data or 0
+        values = {
+            'title': form.title.data,
+            'author': form.author.data or None,
+            'isbn': form.isbn.data or None,
+            'publication_year': form.publication_year.data,
+            'description': form.description.data or None,
+            'category_id': form.category_id.data,
+            'added_by': added_by,
+            'copies_count': copies,
+            'available_copies': copies,
+            'available': copies > 0,
+            'created_at': now,
+        }
+        for key, source in SEARCH_KEYS.items():
+            values[key] = normalize_text(values[source])
+        batch.append((values, copies))
+
+        if len(batch) >= batch_size:
+            result.copies += _insert_batch(batch)
+            result.inserted += len(batch)
+            batch = []
+            if progress:
+                progress(result)
+
+    if batch:
+        result.copies += _insert_batch(batch)
+        result.inserted += len(batch)
+        if progress:
+            progress(result)
+
+    # التصنيفات الجديدة تحفظ حتى لو لم يبق صف صالح في الدفعة الأخيرة
+    db.session.commit()
+    return result
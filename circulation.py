@@ -0,0 +1,114 @@
+from sqlalchemy.orm import joinedload
+from __init__ import db
+from models import User, Book, BookCopy, BookHold, BookReservation
+from reservation_engine import (ACTIVE_STATUSES, ReservationError, approve_loan, return_loan,
+                                checkout_copy, claim_hold)
+
+# مكتب الإعارة: كل مسح (رمز شريطي لنسخة أو رقم معياري) يعالج في طلب واحد باستعلامات
+# مطابقة تامة على أعمدة مفهرسة (barcode و isbn و username والحجز النشط لكل نسخة)
+# مسح نسخة معارة يسجل إعادتها، ومسح نسخة متاحة أو محجوزة للطالب يسجل إعارتها له
+
+class CirculationError(Exception):
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.status = status
+
+def find_user(username):
+    return User.query.filter_by(username=username).first()
+
+# الرمز الشريطي للنسخة أولاً ثم الرقم المعياري؛ يرجع (الكتاب، النسخة أو None)
+def find_by_code(code):
+    copy = BookCopy.query.options(joinedload(BookCopy.book)).filter_by(barcode=code).first()
+    if copy is not None:
+        return copy.book, copy
+    return Book.query.filter_by(isbn=code).first(), None
+
+def _active_loan(**criteria):
+    return BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book)) \
+        .filter_by(**criteria).filter(BookReservation.status.in_(ACTIVE_STATUSES)).first()
+
+def loan_summary(action, reservation):
+    return {
+        'action': action,
+        'reservation_id': reservation.id,
+        'book': reservation.book.title,
+        'user': reservation.user.name,
+        'username': reservation.user.username,
+        'due_date': reservation.due_date.strftime('%Y-%m-%d') if reservation.due_date else None,
+    }
+
+def lookup(code):
+    book, copy = find_by_code(code)
+    if book is not None:
+        return {
+            'type': 'copy' if copy else 'book',
+            'book_id': book.id,
+            'title': book.title,
+            'isbn': book.isbn,
+            'available_copies': book.available_copies,
+            'copy_status': copy.status if copy else None,
+        }
+
+    user = find_user(code)
+    if user is not None:
+        loans = BookReservation.query.options(joinedload(BookReservation.book)) \
+            .filter(BookReservation.user_id == user.id, BookReservation.status.in_(ACTIVE_STATUSES)).all()
+        return {
+            'type': 'user',
+            'username': user.username,
+            'name': user.name,
+            'loans': [{'reservation_id': r.id, 'book': r.book.title, 'status': r.status,
+                       'due_date': r.due_date.strftime('%Y-%m-%d') if r.due_date else None} for r in loans],
+        }
+
+    raise CirculationError('لم يتم العثور على الرمز', 404)
+
+def _checkout_for(user, loan):
+    if loan.user_id != user.id:
+        raise CirculationError('هذه النسخة محجوزة لمستخدم آخر')
+    if loan.status == 'pending':
+        approve_loan(loan)
+    return loan_summary('checkout', loan)
+
+# معالجة مسح واحد؛ اسم المستخدم مطلوب للإعارة فقط
+def scan(code, username=None):
+    book, copy = find_by_code(code)
+    if book is None:
+        raise CirculationError('لم يتم العثور على الكتاب', 404)
+
+    user = find_user(username) if username else None
+    if username and user is None:
+        raise CirculationError('لم يتم العثور على المستخدم', 404)
+
+    try:
+        if copy is not None:
+            loan = _active_loan(copy_id=copy.id)
+            if loan is not None and loan.status == 'approved':
+                return_loan(loan)
+                return loan_summary('return', loan)
+            if user is None:
+                raise CirculationError('يرجى مسح بطاقة الطالب أولاً', 400)
+            if loan is not None:
+                return _checkout_for(user, loan)
+
+            hold = BookHold.query.filter_by(copy_id=copy.id, status='ready').first()
+            if hold is not None:
+                if hold.user_id != user.id:
+                    raise CirculationError('هذه النسخة محجوزة لمستخدم في قائمة الانتظار')
+                return _checkout_for(user, claim_hold(user, hold))
+
+            return loan_summary('checkout', checkout_copy(user, book, copy.id))
+
+        # مسح الرقم المعياري: يطبق على حجز الطالب لهذا الكتاب إن وجد، وإلا تعار أي نسخة متاحة
+        if user is None:
+            raise CirculationError('يرجى مسح بطاقة الطالب أولاً', 400)
+        loan = _active_loan(user_id=user.id, book_id=book.id)
+        if loan is not None and loan.status == 'approved':
+            return_loan(loan)
+            return loan_summary('return', loan)
+        if loan is not None:
+            return _checkout_for(user, loan)
+        return loan_summary('checkout', checkout_copy(user, book))
+    except ReservationError as e:
+        db.session.rollback()
+        raise CirculationError(str(e))
@@ -0,0 +1,119 @@
+import click
+
+# أوامر سطر الأوامر الخاصة بالتطبيق (flask <command>)
+def register_commands(app):
+    from __init__ import db
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        from migrations import run_migrations
+        applied = run_migrations(db)
+        if applied:
+            click.echo('تم تطبيق الترحيلات: {}'.format(', '.join(str(v) for v in applied)))
+        else:
+            click.echo('قاعدة البيانات محدثة')
+
+    @app.cli.command('repair-counts')
+    def repair_counts():
+        from counters import repair_category_counts
+        from models import Book, Category
+        with db.engine.begin() as connection:
+            categories = repair_category_counts(connection, Book.__table__, Category.__table__)
+        click.echo('تم إعادة حساب عدادات {} تصنيف'.format(categories))
+
+    @app.cli.command('backfill-stats')
+    def backfill_stats():
+        from reservation_stats import backfill_reservation_stats
+        rows = backfill_reservation_stats()
+        click.echo('تم بناء {} صف من الإحصائيات'.format(rows))
+
+    @app.cli.command('expire-holds')
+    def expire_holds_command():
+        from holds import expire_holds
+        expired = expire_holds()
+        click.echo('تم إنهاء {} طلب انتظار لم يستلم'.format(expired))
+
+    @app.cli.command('import-catalog')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--create-categories', is_flag=True, help='إنشاء التصنيفات غير الموجودة')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='ملف CSV لتقرير الأخطاء')
+    def import_catalog_command(path, create_categories, batch_size, errors_path):
+        from catalog_import import open_reader, import_catalog
+        from cache import invalidate_pages
+        from models import User
+        admin_id = User.query.filter_by(role='admin').first().id
+
+        def report(result):
+            click.echo('تمت معالجة {} صف، أضيف {} كتاب'.format(result.rows, result.inserted))
+
+        with open(path, 'rb') as stream:
+            result = import_catalog(open_reader(stream, path), admin_id, create_categories=create_categories,
+                                    batch_size=batch_size, progress=report)
+
+        invalidate_pages('catalog')
+        click.echo('أضيف {} كتاب و {} نسخة، وتخطي {} صف'.format(result.inserted, result.copies, result.skipped))
+        if result.errors and errors_path:
+            with open(errors_path, 'w', newline='', encoding='utf-8') as stream:
+                result.write_errors(stream)
+            click.echo('تقرير الأخطاء: {}'.format(errors_path))
+        elif result.errors:
+            for row_number, error in result.errors:
+                click.echo('{}: {}'.format(row_number, error))
+
+    @app.cli.command('export')
+    @click.argument('dataset', type=click.Choice(['books', 'reservations', 'resource_reservations']))
+    @click.option('--format', 'export_format', type=click.Choice(['csv', 'jsonl', 'xlsx']), default='csv', show_default=True)
+    @click.option('--output', type=click.Path(dir_okay=False), help='مسار الملف (الافتراضي: اسم المجموعة والتاريخ)')
+    @click.option('--start', help='YYYY-MM-DD')
+    @click.option('--end', help='YYYY-MM-DD')
+    @click.option('--status')
+    @click.option('--category-id', 'category_id')
+    def export_command(dataset, export_format, output, **filters):
+        from catalog_export import export_rows, iter_csv, iter_jsonl, write_excel, parse_export_filters, export_filename
+        columns, rows = export_rows(dataset, parse_export_filters(filters))
+        output = output or export_filename(dataset, export_format)
+
+        if export_format == 'xlsx':
+            with open(output, 'wb') as stream:
+                write_excel(columns, rows, stream)
+        else:
+            chunks = iter_csv(columns, rows) if export_format == 'csv' else iter_jsonl(columns, rows)
+            with open(output, 'w', newline='', encoding='utf-8') as stream:
+                for chunk in chunks:
+                    stream.write(chunk)
+        click.echo('تم التصدير إلى {}'.format(output))
+
+    @app.cli.command('run-jobs')
+    @click.option('--once', is_flag=True, help='تنفيذ المهام المستحقة مرة واحدة ثم الخروج')
+    def run_jobs(once):
+        from jobs import schedule_periodic_jobs, recover_stale_jobs, run_pending_jobs, start_worker
+        if once:
+            schedule_periodic_jobs()
+            recover_stale_jobs()
+            click.echo('تم تنفيذ {} مهمة'.format(run_pending_jobs()))
+            return
+        click.echo('عامل المهام يعمل (Ctrl+C للإيقاف)')
+        stop = start_worker(app)
+        try:
+            while not stop.wait(3600):
+                pass
+        except KeyboardInterrupt:
+            stop.set()
+
+    # يعمل خارج سياق التطبيق حتى ينشئ كل طلب سياقه الخاص (g والجلسة)
+    @app.cli.command('check-scans', with_appcontext=False)
+    def check_scans():
+        from models import User
+        from query_plan import check_routes
+        with app.app_context():
+            admin_id = User.query.filter_by(role='admin').first().id
+        reports = check_routes(app, db, admin_id)
+        if not reports:
+            click.echo('لا توجد مسارات تمسح جداول كاملة')
+            return
+        for endpoint, statements in sorted(reports.items()):
+            click.echo(endpoint)
+            for statement in statements:
+                click.echo('    ' + ' '.join(statement.split()))
+        raise SystemExit(1)
@@ -0,0 +1,76 @@
+from sqlalchemy import event, inspect, update, select, func, case
+
+# عدادات الكتب لكل تصنيف (book_count و available_count) محفوظة في جدول التصنيفات
+# تحدث داخل نفس المعاملة عند إضافة كتاب أو تعديله أو حذفه أو تغير توفره،
+# فلا تحتاج صفحات التصنيفات إلى قراءة جدول الكتب
+
+def _is_available(value):
+    return value is None or bool(value)
+
+def adjust_category_counts(connection, category_table, category_id, books, available):
+    if category_id is None or (books == 0 and available == 0):
+        return
+    connection.execute(
+        update(category_table)
+        .where(category_table.c.id == category_id)
+        .values(book_count=category_table.c.book_count + books,
+                available_count=category_table.c.available_count + available)
+    )
+
+def _previous(history, current):
+    if history.deleted:
+        return history.deleted[0]
+    return current
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+def register_category_counters(book_model, category_model):
+    category_table = category_model.__table__
+
+    # تحميل القيمة السابقة عند التعديل حتى لو كان الكائن منتهي الصلاحية بعد commit
+    event.listen(book_model.category_id, 'set', _load_old_value, active_history=True, retval=True)
+    event.listen(book_model.available, 'set', _load_old_value, active_history=True, retval=True)
+
+    @event.listens_for(book_model, 'after_insert')
+    def book_inserted(mapper, connection, target):
+        adjust_category_counts(connection, category_table, target.category_id, 1, int(_is_available(target.available)))
+
+    @event.listens_for(book_model, 'after_delete')
+    def book_deleted(mapper, connection, target):
+        adjust_category_counts(connection, category_table, target.category_id, -1, -int(_is_available(target.available)))
+
+    @event.listens_for(book_model, 'after_update')
+    def book_updated(mapper, connection, target):
+        state = inspect(target)
+        category_history = state.attrs.category_id.history
+        available_history = state.attrs.available.history
+        if not category_history.has_changes() and not available_history.has_changes():
+            return
+
+        old_category = _previous(category_history, target.category_id)
+        old_available = int(_is_available(_previous(available_history, target.available)))
+        new_available = int(_is_available(target.available))
+
+        if old_category == target.category_id:
+            adjust_category_counts(connection, category_table, target.category_id, 0, new_available - old_available)
+        else:
+            adjust_category_counts(connection, category_table, old_category, -1, -old_available)
+            adjust_category_counts(connection, category_table, target.category_id, 1, new_available)
+
+# إعادة حساب العدادات من جدول الكتب باستعلام تجميعي واحد
+def repair_category_counts(connection, book_table, category_table):
+    available = case((book_table.c.available.is_(False), 0), else_=1)
+    totals = connection.execute(
+        select(book_table.c.category_id, func.count(), func.sum(available))
+        .group_by(book_table.c.category_id)
+    ).all()
+
+    connection.execute(update(category_table).values(book_count=0, available_count=0))
+    for category_id, books, available_books in totals:
+        connection.execute(
+            update(category_table)
+            .where(category_table.c.id == category_id)
+            .values(book_count=books, available_count=available_books or 0)
+        )
+    return len(totals)
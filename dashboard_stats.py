@@ -0,0 +1,35 @@
+from datetime import datetime
+from sqlalchemy import select, func
+from __init__ import db
+from models import User, Category, BookReservation
+from snapshot_cache import SnapshotCache
+
+# إحصائيات لوحة التحكم في استعلام واحد (استعلامات فرعية عددية تستخدم الفهارس)
+# مع تخزين النتيجة لمدة قصيرة DASHBOARD_STATS_TTL ثانية
+RESERVATION_STATUSES = ('pending', 'approved', 'returned', 'rejected')
+
+def _count(*criteria):
+    return select(func.count(BookReservation.id)).where(*criteria).scalar_subquery()
+
+def compute_dashboard_stats():
+    columns = [
+        select(func.count(User.id)).scalar_subquery().label('users_count'),
+        select(func.count(Category.id)).scalar_subquery().label('categories_count'),
+        select(func.coalesce(func.sum(Category.book_count), 0)).scalar_subquery().label('books_count'),
+        select(func.coalesce(func.sum(Category.available_count), 0)).scalar_subquery().label('available_books_count'),
+        select(func.count(BookReservation.id)).scalar_subquery().label('reservations_count'),
+        _count(BookReservation.status == 'approved',
+               BookReservation.due_date < datetime.now()).label('overdue_count'),
+    ]
+    columns += [_count(BookReservation.status == status).label('{}_count'.format(status))
+                for status in RESERVATION_STATUSES]
+
+    row = db.session.execute(select(*columns)).one()
+    stats = dict(row._mapping)
+    stats['borrowed_books_count'] = stats['books_count'] - stats['available_books_count']
+    return stats
+
+_stats = SnapshotCache(compute_dashboard_stats, 'DASHBOARD_STATS_TTL', 30)
+
+def get_dashboard_stats():
+    return _stats.get()
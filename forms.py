@@ -3,6 +3,8 @@ from wtforms import StringField, PasswordField, BooleanField, SelectField, DateF
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, Email
 from datetime import datetime, date
 import calendar
+from school_calendar import is_open_day
+from timetable import period_choices, is_valid_period
 
 class LoginForm(FlaskForm):
     username = StringField('اسم المستخدم', validators=[DataRequired(message='يرجى إدخال اسم المستخدم')])
@@ -31,22 +33,30 @@ class BookReservationForm(FlaskForm):
         if field.data < date.today():
             raise ValidationError('لا يمكن اختيار تاريخ في الماضي')
         
-        # التحقق من أن التاريخ ليس يوم الجمعة أو السبت
-        day_of_week = field.data.weekday()
-        if day_of_week == 4 or day_of_week == 5:  # 4 = الجمعة، 5 = السبت
-            raise ValidationError('لا يمكن حجز الكتب في أيام الجمعة والسبت')
+        # التحقق من أن التاريخ يوم دوام في التقويم المدرسي (ليس الجمعة أو السبت أو عطلة)
+        if not is_open_day(field.data):
+            raise ValidationError('لا يمكن حجز الكتب في أيام العطل')
 
 class ResourceReservationForm(FlaskForm):
     resource_id = StringField('المورد', validators=[DataRequired(message='يرجى اختيار المورد')])
     date = DateField('التاريخ', validators=[DataRequired(message='يرجى اختيار التاريخ')])
-    period = SelectField('الحصة', choices=[(str(i), f'الحصة {i}') for i in range(1, 9)], validators=[DataRequired(message='يرجى اختيار الحصة')])
+    period = SelectField('الحصة', validators=[DataRequired(message='يرجى اختيار الحصة')])
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # الحصص من الجدول الزمني المخزن
+        self.period.choices = period_choices()
+    
+    def validate_period(self, field):
+        # بعض الأيام لها جدول مختلف (مثل دوام الخميس القصير)
+        if self.date.data and not is_valid_period(self.date.data, int(field.data)):
+            raise ValidationError('هذه الحصة غير موجودة في جدول هذا اليوم')
     
     def validate_date(self, field):
         # التحقق من أن التاريخ ليس في الماضي
         if field.data < date.today():
             raise ValidationError('لا يمكن اختيار تاريخ في الماضي')
         
-        # التحقق من أن التاريخ ليس يوم الجمعة أو السبت
-        day_of_week = field.data.weekday()
-        if day_of_week == 4 or day_of_week == 5:  # 4 = الجمعة، 5 = السبت
-            raise ValidationError('لا يمكن حجز المختبرات في أيام الجمعة والسبت')
+        # التحقق من أن التاريخ يوم دوام في التقويم المدرسي (ليس الجمعة أو السبت أو عطلة)
+        if not is_open_day(field.data):
+            raise ValidationError('لا يمكن حجز المختبرات في أيام العطل')
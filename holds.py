@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, func
+from __init__ import db
+from models import User, Book, BookHold, BookReservation
+from outbox import queue_notification
+
+# قائمة انتظار الكتب: عند إعادة نسخة تنتقل مباشرة إلى أول منتظر (بدلاً من الرف)
+# ويمنح مهلة HOLD_READY_DAYS لاستلامها، وإلا تنتقل إلى التالي
+ACTIVE_HOLD_STATUSES = ('waiting', 'ready')
+
+class HoldError(Exception):
+    pass
+
+def place_hold(user, book):
+    if book.available_copies > 0:
+        raise HoldError('الكتاب متاح حالياً، يمكنك حجزه مباشرة')
+
+    borrowed = BookReservation.query.filter(BookReservation.user_id == user.id,
+                                            BookReservation.book_id == book.id,
+                                            BookReservation.status.in_(('pending', 'approved'))).first()
+    if borrowed:
+        raise HoldError('لديك حجز قائم لهذا الكتاب')
+
+    existing = BookHold.query.filter(BookHold.user_id == user.id,
+                                     BookHold.book_id == book.id,
+                                     BookHold.status.in_(ACTIVE_HOLD_STATUSES)).first()
+    if existing:
+        raise HoldError('أنت في قائمة الانتظار لهذا الكتاب بالفعل')
+
+    hold = BookHold(book_id=book.id, user_id=user.id, status='waiting')
+    db.session.add(hold)
+    db.session.commit()
+    return hold
+
+# ترتيب المنتظر في الطابور (1 = التالي)
+def hold_position(hold):
+    if hold.status != 'waiting':
+        return None
+    ahead = db.session.execute(
+        select(func.count(BookHold.id))
+        .where(BookHold.book_id == hold.book_id, BookHold.status == 'waiting', BookHold.id < hold.id)
+    ).scalar()
+    return ahead + 1
+
+# منح النسخة المعادة لأول منتظر بتحديث مشروط واحد (لا يمنح نفس الدور مرتين)
+# يرجع معرف الدور أو None إذا كان الطابور فارغاً
+def promote_next_hold(book_id, copy_id):
+    hold_table = BookHold.__table__
+    head = select(hold_table.c.id) \
+        .where(hold_table.c.book_id == book_id, hold_table.c.status == 'waiting') \
+        .order_by(hold_table.c.id).limit(1).scalar_subquery()
+
+    ready_until = datetime.now() + timedelta(days=current_app.config.get('HOLD_READY_DAYS', 2))
+    promoted = db.session.execute(
+        update(hold_table)
+        .where(hold_table.c.id == head, hold_table.c.status == 'waiting')
+        .values(status='ready', copy_id=copy_id, ready_until=ready_until)
+        .returning(hold_table.c.id, hold_table.c.user_id)
+    ).first()
+    if promoted is None:
+        return None
+
+    queue_notification(db.session.get(User, promoted.user_id), 'hold_ready',
+                       title=db.session.get(Book, book_id).title, ready_until=ready_until)
+    return promoted.id
+
+# تمرير نسخة دور منته أو ملغى إلى التالي، أو إعادتها للرف
+def _pass_on(book_id, copy_id):
+    from inventory import shelve_copy
+    if promote_next_hold(book_id, copy_id) is None:
+        shelve_copy(book_id, copy_id)
+
+# الإلغاء والإنهاء تحديثات مشروطة بالحالة مثل الاستلام (claim_hold)، فلا تمرر نسخة دور
+# استلمه صاحبه في نفس اللحظة، ولا تمرر نفس النسخة مرتين
+def cancel_hold(hold):
+    hold_table = BookHold.__table__
+    released = db.session.execute(
+        update(hold_table)
+        .where(hold_table.c.id == hold.id, hold_table.c.status == 'ready')
+        .values(status='cancelled')
+        .returning(hold_table.c.book_id, hold_table.c.copy_id)
+    ).first()
+    if released is not None:
+        _pass_on(released.book_id, released.copy_id)
+    else:
+        db.session.execute(
+            update(hold_table)
+            .where(hold_table.c.id == hold.id, hold_table.c.status == 'waiting')
+            .values(status='cancelled')
+        )
+    db.session.expire(hold, ['status'])
+    db.session.commit()
+
+# إنهاء الأدوار الجاهزة التي لم تستلم في المهلة
+def expire_holds(now=None):
+    now = now or datetime.now()
+    hold_table = BookHold.__table__
+    expired = db.session.execute(
+        update(hold_table)
+        .where(hold_table.c.status == 'ready', hold_table.c.ready_until < now)
+        .values(status='expired')
+        .returning(hold_table.c.id, hold_table.c.book_id, hold_table.c.copy_id)
+    ).all()
+
+    for hold in sorted(expired):
+        _pass_on(hold.book_id, hold.copy_id)
+
+    db.session.commit()
+    return len(expired)
@@ -0,0 +1,172 @@
+from collections import Counter
+from sqlalchemy import update, select, func, bindparam
+from __init__ import db
+from models import Book, BookCopy, BookHold, Category
+from counters import adjust_category_counts
+from holds import promote_next_hold
+
+# إدارة نسخ الكتب: حجز نسخة أو إعادتها بعدد ثابت من الاستعلامات المفهرسة
+# مهما كان عدد النسخ، مع إبقاء available_copies و available في صف الكتاب متزامنين
+
+def make_barcode(book_id, number):
+    return 'B{:06d}-{:02d}'.format(book_id, number)
+
+# إضافة نسخ جديدة لكتاب (يجب أن يكون للكتاب معرف، أي بعد flush)
+# العدادات تزاد بتحديث مباشر على صف الكتاب كما في allocate_copy و shelve_copy، فلا تضيع
+# إعارة أو إعادة متزامنة بين تحميل الكتاب وحفظ التعديل
+def add_copies(book, count, condition='good'):
+    if count <= 0:
+        return
+    book_table = Book.__table__
+
+    became_available = db.session.execute(
+        update(book_table)
+        .where(book_table.c.id == book.id, book_table.c.available.is_(False))
+        .values(available=True)
+        .returning(book_table.c.category_id)
+    ).first()
+    if became_available is not None:
+        adjust_category_counts(db.session.connection(), Category.__table__, became_available.category_id, 0, 1)
+
+    copies_count = db.session.execute(
+        update(book_table)
+        .where(book_table.c.id == book.id)
+        .values(copies_count=func.coalesce(book_table.c.copies_count, 0) + count,
+                available_copies=func.coalesce(book_table.c.available_copies, 0) + count)
+        .returning(book_table.c.copies_count)
+    ).scalar()
+
+    start = copies_count - count
+    for number in range(start + 1, copies_count + 1):
+        db.session.add(BookCopy(book_id=book.id, barcode=make_barcode(book.id, number), condition=condition))
+    db.session.expire(book, ['copies_count', 'available_copies', 'available'])
+
+# حجز نسخة متاحة: تحديث مشروط على صف الكتاب ثم تخصيص أول نسخة متاحة (أو النسخة المحددة)
+# يرجع (معرف التصنيف، معرف النسخة) أو None إذا لم توجد نسخة متاحة، وعندها يجب التراجع
+# عن المعاملة لأن عداد الكتاب قد يكون نقص
+def allocate_copy(book_id, copy_id=None):
+    book_table = Book.__table__
+    copy_table = BookCopy.__table__
+
+    taken = db.session.execute(
+        update(book_table)
+        .where(book_table.c.id == book_id, book_table.c.available_copies > 0)
+        .values(available_copies=book_table.c.available_copies - 1,
+                available=book_table.c.available_copies > 1)
+        .returning(book_table.c.category_id, book_table.c.available_copies)
+    ).first()
+    if taken is None:
+        return None
+
+    target = copy_id
+    if target is None:
+        target = select(copy_table.c.id) \
+            .where(copy_table.c.book_id == book_id, copy_table.c.status == 'available') \
+            .limit(1).scalar_subquery()
+    allocated = db.session.execute(
+        update(copy_table)
+        .where(copy_table.c.id == target, copy_table.c.book_id == book_id, copy_table.c.status == 'available')
+        .values(status='reserved')
+        .returning(copy_table.c.id)
+    ).scalar()
+    if copy_id is not None and allocated is None:
+        return None
+
+    # التحديث المباشر لا يمر بأحداث النموذج، فتعدل عدادات التصنيف هنا
+    if taken.available_copies == 0:
+        adjust_category_counts(db.session.connection(), Category.__table__, taken.category_id, 0, -1)
+
+    return taken.category_id, allocated
+
+# إعادة نسخة إلى الرف وزيادة عدد النسخ المتاحة للكتاب
+def shelve_copy(book_id, copy_id):
+    book_table = Book.__table__
+    copy_table = BookCopy.__table__
+
+    if copy_id is not None:
+        db.session.execute(
+            update(copy_table)
+            .where(copy_table.c.id == copy_id, copy_table.c.status == 'reserved')
+            .values(status='available')
+        )
+
+    released = db.session.execute(
+        update(book_table)
+        .where(book_table.c.id == book_id,
+               book_table.c.available_copies < book_table.c.copies_count)
+        .values(available_copies=book_table.c.available_copies + 1, available=True)
+        .returning(book_table.c.category_id, book_table.c.available_copies)
+    ).first()
+
+    if released is not None and released.available_copies == 1:
+        adjust_category_counts(db.session.connection(), Category.__table__, released.category_id, 0, 1)
+
+# إعادة النسخة المخصصة للحجز (تستدعى قبل تغيير حالة الحجز)
+# إذا كان للكتاب قائمة انتظار تبقى النسخة محجوزة لأول منتظر بدلاً من الرف
+# الحجوزات المرفوضة أو المعادة سابقاً لا تحجز نسخة فلا يعاد شيء
+def release_copy(reservation):
+    if reservation.status not in ('pending', 'approved'):
+        return False
+
+    if reservation.copy_id is not None and promote_next_hold(reservation.book_id, reservation.copy_id):
+        return True
+
+    shelve_copy(reservation.book_id, reservation.copy_id)
+    return True
+
+# إعادة نسخ مجموعة حجوزات دفعة واحدة (للإجراءات الجماعية، بعد تغيير حالتها بتحديث واحد)
+# النسخ التي لكتبها منتظرون تمنح لهم بالترتيب، والباقي يعاد إلى الرف بتحديث واحد للنسخ
+# وتحديث واحد متعدد القيم لعدادات الكتب، ثم تعدل عدادات التصنيفات مرة لكل تصنيف
+def release_copies(released):
+    book_table = Book.__table__
+    copy_table = BookCopy.__table__
+    book_ids = {book_id for book_id, copy_id in released}
+
+    waiting = dict(db.session.execute(
+        select(BookHold.book_id, func.count(BookHold.id))
+        .where(BookHold.book_id.in_(book_ids), BookHold.status == 'waiting')
+        .group_by(BookHold.book_id)
+    ).all())
+
+    shelved = []
+    for book_id, copy_id in released:
+        if copy_id is not None and waiting.get(book_id) and promote_next_hold(book_id, copy_id):
+            waiting[book_id] -= 1
+            continue
+        shelved.append((book_id, copy_id))
+    if not shelved:
+        return
+
+    copy_ids = [copy_id for book_id, copy_id in shelved if copy_id is not None]
+    if copy_ids:
+        db.session.execute(
+            update(copy_table)
+            .where(copy_table.c.id.in_(copy_ids), copy_table.c.status == 'reserved')
+            .values(status='available')
+        )
+
+    freed = Counter(book_id for book_id, copy_id in shelved)
+    books = db.session.execute(
+        select(book_table.c.id, book_table.c.category_id, book_table.c.available_copies, book_table.c.copies_count)
+        .where(book_table.c.id.in_(freed))
+    ).all()
+
+    values = []
+    restocked = Counter()
+    for book in books:
+        available_copies = min(book.available_copies + freed[book.id], book.copies_count)
+        if available_copies == book.available_copies:
+            continue
+        values.append({'book_id': book.id, 'new_available_copies': available_copies})
+        if book.available_copies == 0 and available_copies > 0:
+            restocked[book.category_id] += 1
+
+    if values:
+        db.session.execute(
+            update(book_table)
+            .where(book_table.c.id == bindparam('book_id'))
+            .values(available_copies=bindparam('new_available_copies'), available=True),
+            values
+        )
+    for category_id, count in restocked.items():
+        adjust_category_counts(db.session.connection(), Category.__table__, category_id, 0, count)
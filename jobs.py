@@ -0,0 +1,172 @@
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import joinedload
+from __init__ import db
+from models import Job, BookReservation
+from outbox import queue_notification, send_pending_notifications
+from holds import expire_holds
+
+# مشغل المهام الخلفية: جدول jobs في قاعدة البيانات نفسها بدلاً من وسيط خارجي
+# العامل (خيط داخل عملية الخادم أو أمر flask run-jobs في عملية مستقلة) يحجز المهمة
+# التالية المستحقة بتحديث مشروط واحد، فيمكن تشغيل أكثر من عامل دون تنفيذ المهمة مرتين،
+# ولا ينتظر أي طلب ويب تنفيذ المهام
+
+JOB_HANDLERS = {}
+
+# المهام الدورية: الاسم والفاصل بالثواني
+PERIODIC_JOBS = {
+    'detect_overdue': 15 * 60,
+    'send_notifications': 60,
+    'expire_holds': 5 * 60,
+}
+
+JOB_MAX_ATTEMPTS = 5
+
+def job_handler(name):
+    def decorator(f):
+        JOB_HANDLERS[name] = f
+        return f
+    return decorator
+
+# إضافة مهمة دورية إذا لم تكن في الطابور أو قيد التنفيذ؛ الفهرس الفريد على unique_key
+# يجعل الإدراج يتجاهل النسخة الثانية حتى لو جدول عاملان (خيط الخادم و flask run-jobs) معاً
+def enqueue_periodic(name, run_at=None):
+    db.session.execute(
+        insert(Job.__table__)
+        .values(name=name, payload='{}', status='queued', run_at=run_at or datetime.now(),
+                attempts=0, unique_key=name, created_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+
+def schedule_periodic_jobs():
+    for name in PERIODIC_JOBS:
+        enqueue_periodic(name)
+    db.session.commit()
+
+# إعادة المهام التي توقف عاملها أثناء التنفيذ إلى الطابور
+def recover_stale_jobs():
+    timeout = current_app.config.get('JOB_LOCK_TIMEOUT', 600)
+    table = Job.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.status == 'running', table.c.locked_at < datetime.now() - timedelta(seconds=timeout))
+        .values(status='queued', locked_at=None)
+    )
+    db.session.commit()
+
+def claim_next_job(now=None):
+    now = now or datetime.now()
+    table = Job.__table__
+    due = select(table.c.id) \
+        .where(table.c.status == 'queued', table.c.run_at <= now) \
+        .order_by(table.c.run_at).limit(1).scalar_subquery()
+    row = db.session.execute(
+        update(table)
+        .where(table.c.id == due, table.c.status == 'queued')
+        .values(status='running', locked_at=now, attempts=table.c.attempts + 1)
+        .returning(table.c.id, table.c.name, table.c.payload, table.c.attempts)
+    ).first()
+    db.session.commit()
+    return row
+
+def _finish(job_id, **values):
+    table = Job.__table__
+    db.session.execute(update(table).where(table.c.id == job_id).values(locked_at=None, **values))
+
+# تنفيذ مهمة محجوزة؛ الفشل يعيد المحاولة بتأخير متزايد حتى JOB_MAX_ATTEMPTS
+def run_job(row):
+    now = datetime.now()
+    try:
+        JOB_HANDLERS[row.name](json.loads(row.payload or '{}'))
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()[-2000:]
+        current_app.logger.warning('فشلت المهمة %s (%s): %s', row.id, row.name, error)
+        if row.attempts < JOB_MAX_ATTEMPTS:
+            _finish(row.id, status='queued', last_error=error, run_at=now + timedelta(minutes=2 ** row.attempts))
+            db.session.commit()
+            return False
+        _finish(row.id, status='failed', last_error=error)
+        succeeded = False
+    else:
+        _finish(row.id, status='done')
+        succeeded = True
+
+    # المهمة الدورية تجدول تشغيلها التالي بعد انتهائها (بنجاح أو بعد استنفاد المحاولات)؛
+    # الصف الحالي خرج من الحالات النشطة، فلا يتعارض مع النسخة الجديدة
+    if row.name in PERIODIC_JOBS:
+        enqueue_periodic(row.name, run_at=now + timedelta(seconds=PERIODIC_JOBS[row.name]))
+    db.session.commit()
+    return succeeded
+
+def run_pending_jobs(limit=100):
+    count = 0
+    while count < limit:
+        row = claim_next_job()
+        if row is None:
+            break
+        run_job(row)
+        count += 1
+    return count
+
+# تشغيل العامل في خيط خلفي داخل عملية الخادم
+def start_worker(app):
+    if 'job_worker' in app.extensions:
+        return app.extensions['job_worker']
+
+    interval = app.config.get('JOB_POLL_INTERVAL', 5)
+    stop = threading.Event()
+
+    def loop():
+        while True:
+            with app.app_context():
+                try:
+                    schedule_periodic_jobs()
+                    recover_stale_jobs()
+                    run_pending_jobs()
+                except Exception:
+                    app.logger.exception('خطأ في عامل المهام الخلفية')
+                finally:
+                    db.session.remove()
+            if stop.wait(interval):
+                break
+
+    thread = threading.Thread(target=loop, name='job-worker', daemon=True)
+    app.extensions['job_worker'] = stop
+    thread.start()
+    return stop
+
+# اكتشاف الاستعارات المتأخرة بتحديث واحد على فهرس (الحالة، موعد الإعادة)
+# وإضافة تنبيه لكل حجز في نفس المعاملة
+@job_handler('detect_overdue')
+def detect_overdue(payload=None):
+    table = BookReservation.__table__
+    now = datetime.now()
+    ids = db.session.execute(
+        update(table)
+        .where(table.c.status == 'approved', table.c.due_date < now, table.c.overdue_at.is_(None))
+        .values(overdue_at=now)
+        .returning(table.c.id)
+    ).scalars().all()
+
+    if ids:
+        reservations = BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book)) \
+            .filter(BookReservation.id.in_(ids)).all()
+        for reservation in reservations:
+            queue_notification(reservation.user, 'overdue', title=reservation.book.title, due_date=reservation.due_date)
+    db.session.commit()
+    return len(ids)
+
+@job_handler('send_notifications')
+def send_notifications(payload=None):
+    return send_pending_notifications()
+
+# إنهاء أدوار الانتظار الجاهزة التي انتهت مهلتها وتمرير نسخها إلى التالي
+@job_handler('expire_holds')
+def expire_ready_holds(payload=None):
+    return expire_holds()
@@ -0,0 +1,183 @@
+from datetime import datetime
+from sqlalchemy import text, inspect
+
+# نظام ترحيل مخطط قاعدة البيانات
+# كل ترحيل له رقم إصدار ووصف، ويسجل تطبيقه في جدول schema_migrations
+# الترحيلات مكتوبة بحيث يمكن إعادة تشغيلها بأمان على قاعدة بيانات جديدة أنشأتها create_all
+MIGRATIONS = []
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        return f
+    return decorator
+
+# إنشاء فهارس معرفة في النماذج إذا لم تكن موجودة
+def create_indexes(connection, metadata, *names):
+    for table in metadata.tables.values():
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+# إضافة أعمدة معرفة في النماذج إلى جدول قديم
+def add_columns(connection, metadata, table_name, *names):
+    table = metadata.tables[table_name]
+    existing = {c['name'] for c in inspect(connection).get_columns(table_name)}
+
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        column_type = column.type.compile(dialect=connection.dialect)
+        default = ''
+        if column.server_default is not None:
+            default = ' DEFAULT {}'.format(column.server_default.arg)
+        connection.execute(text('ALTER TABLE {} ADD COLUMN {} {}{}'.format(table_name, name, column_type, default)))
+
+@migration(1, 'فهارس مركبة لمسارات الحجز والتصفح')
+def _reservation_flow_indexes(connection, metadata):
+    create_indexes(connection, metadata,
+                   'ix_book_reservation_user_status',
+                   'ix_book_reservation_user_created',
+                   'ix_book_reservation_status_created',
+                   'ix_book_reservation_created_at',
+                   'ix_book_category_title',
+                   'ix_book_created_at',
+                   'ix_book_title',
+                   'ix_book_author',
+                   'ix_resource_reservation_date_resource',
+                   'ix_resource_reservation_user_date',
+                   'ix_user_created_at')
+
+@migration(2, 'فهرس ترتيب حجوزات الموارد بالتاريخ لترقيم الصفحات بالمفاتيح')
+def _resource_reservation_date_index(connection, metadata):
+    create_indexes(connection, metadata, 'ix_resource_reservation_date')
+
+@migration(3, 'رقم إصدار شروط الاستعارة للتخزين المؤقت')
+def _borrowing_rules_version(connection, metadata):
+    add_columns(connection, metadata, 'borrowing_rules', 'version')
+
+@migration(4, 'عدادات الكتب المحفوظة لكل تصنيف')
+def _category_counters(connection, metadata):
+    from counters import repair_category_counts
+    add_columns(connection, metadata, 'category', 'book_count', 'available_count')
+    repair_category_counts(connection, metadata.tables['book'], metadata.tables['category'])
+
+@migration(5, 'فهرس الحالة وتاريخ الحجز لعد الحجوزات المتأخرة')
+def _reservation_status_date_index(connection, metadata):
+    create_indexes(connection, metadata, 'ix_book_reservation_status_date')
+
+@migration(6, 'نسخ الكتب: جدول المخزون وعدادات النسخ في صف الكتاب')
+def _book_copies(connection, metadata):
+    add_columns(connection, metadata, 'book', 'copies_count', 'available_copies')
+    add_columns(connection, metadata, 'book_reservation', 'copy_id')
+    create_indexes(connection, metadata, 'ix_book_available_copies', 'ix_book_copy_book_status')
+
+    # نسخة واحدة لكل كتاب قديم، محجوزة إذا كان الكتاب غير متاح
+    connection.execute(text(
+        "INSERT INTO book_copy (book_id, barcode, condition, status, created_at) "
+        "SELECT id, 'B' || printf('%06d', id) || '-01', 'good', "
+        "CASE WHEN available = 0 THEN 'reserved' ELSE 'available' END, created_at FROM book "
+        "WHERE NOT EXISTS (SELECT 1 FROM book_copy WHERE book_copy.book_id = book.id)"
+    ))
+    connection.execute(text(
+        "UPDATE book SET "
+        "copies_count = (SELECT count(*) FROM book_copy WHERE book_copy.book_id = book.id), "
+        "available_copies = (SELECT count(*) FROM book_copy WHERE book_copy.book_id = book.id "
+        "AND book_copy.status = 'available')"
+    ))
+    connection.execute(text(
+        "UPDATE book_reservation SET copy_id = (SELECT id FROM book_copy "
+        "WHERE book_copy.book_id = book_reservation.book_id AND book_copy.status = 'reserved' LIMIT 1) "
+        "WHERE status IN ('pending', 'approved') AND copy_id IS NULL"
+    ))
+
+@migration(7, 'فهارس قائمة انتظار الكتب')
+def _book_hold_indexes(connection, metadata):
+    create_indexes(connection, metadata, 'ix_book_hold_book_status', 'ix_book_hold_user_status',
+                   'ix_book_hold_status_ready_until')
+
+@migration(8, 'موعد الإعادة ووقت التأخير للحجوزات وجدول المهام الخلفية')
+def _due_dates(connection, metadata):
+    add_columns(connection, metadata, 'book_reservation', 'due_date', 'overdue_at')
+    create_indexes(connection, metadata, 'ix_book_reservation_status_due', 'ix_job_status_run_at', 'ix_job_name_status')
+
+    # الحجوزات المعتمدة سابقاً: موعد الإعادة من تاريخ الحجز وأيام الاستعارة الحالية
+    connection.execute(text(
+        "UPDATE book_reservation SET due_date = datetime(reservation_date, '+' || "
+        "COALESCE((SELECT max_days FROM borrowing_rules ORDER BY id LIMIT 1), 7) || ' days') "
+        "WHERE status = 'approved' AND due_date IS NULL"
+    ))
+
+@migration(9, 'عدد مرات تمديد الاستعارة')
+def _reservation_renewals(connection, metadata):
+    add_columns(connection, metadata, 'book_reservation', 'renewals')
+
+@migration(10, 'البريد الإلكتروني للمستخدمين وفهارس صندوق التنبيهات')
+def _notifications(connection, metadata):
+    add_columns(connection, metadata, 'user', 'email')
+    create_indexes(connection, metadata, 'ix_notification_status_next', 'ix_notification_user_channel_read')
+
+@migration(11, 'فهارس مكتب الإعارة: الرقم المعياري والحجز النشط لكل نسخة')
+def _circulation_indexes(connection, metadata):
+    create_indexes(connection, metadata, 'ix_book_isbn', 'ix_book_reservation_copy_status')
+
+@migration(12, 'سلاسل حجز المختبرات المتكررة')
+def _resource_series(connection, metadata):
+    add_columns(connection, metadata, 'resource_reservation', 'series_id')
+    create_indexes(connection, metadata, 'ix_resource_reservation_series', 'ix_resource_reservation_series_user')
+
+@migration(13, 'فهرس التقويم المدرسي')
+def _school_calendar(connection, metadata):
+    create_indexes(connection, metadata, 'ix_school_calendar_kind_start')
+
+@migration(14, 'فهرس فريد لحصص اليوم العادي في الجدول الزمني')
+def _regular_periods_index(connection, metadata):
+    create_indexes(connection, metadata, 'ux_period_regular_number')
+
+@migration(15, 'نسخة واحدة من كل مهمة دورية في طابور المهام')
+def _unique_periodic_jobs(connection, metadata):
+    from jobs import PERIODIC_JOBS
+    add_columns(connection, metadata, 'job', 'unique_key')
+
+    # حذف النسخ المكررة المنتظرة من كل مهمة دورية، والإبقاء على الأقدم أو التي قيد التنفيذ
+    names = ', '.join("'{}'".format(name) for name in PERIODIC_JOBS)
+    connection.execute(text(
+        "DELETE FROM job WHERE status = 'queued' AND name IN ({}) AND EXISTS ("
+        "SELECT 1 FROM job AS other WHERE other.name = job.name AND other.status IN ('queued', 'running') "
+        "AND (other.status = 'running' OR other.id < job.id))".format(names)
+    ))
+    connection.execute(text(
+        "UPDATE job SET unique_key = name WHERE name IN ({}) AND status IN ('queued', 'running') "
+        "AND id = (SELECT min(other.id) FROM job AS other WHERE other.name = job.name "
+        "AND other.status IN ('queued', 'running'))".format(names)
+    ))
+    create_indexes(connection, metadata, 'ux_job_unique_key_active')
+
+def applied_versions(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)"
+    ))
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+# تطبيق الترحيلات غير المطبقة بالترتيب، كل ترحيل في معاملة مستقلة
+def run_migrations(db):
+    applied = []
+
+    with db.engine.begin() as connection:
+        done = applied_versions(connection)
+
+    for version, description, apply in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+
+        with db.engine.begin() as connection:
+            apply(connection, db.metadata)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        applied.append(version)
+
+    return applied
@@ -1,9 +1,8 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
-
-# إنشاء قاعدة البيانات
-db = SQLAlchemy()
+from __init__ import db
+from search import register_search_keys
+from counters import register_category_counters
 
 # جدول المستخدمين
 class User(db.Model, UserMixin):
@@ -13,17 +12,25 @@ class User(db.Model, UserMixin):
     name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='student')  # student, teacher, admin, librarian
     grade = db.Column(db.String(20), nullable=True)  # الصف للطلاب
+    email = db.Column(db.String(120), nullable=True)  # لإرسال التنبيهات بالبريد (اختياري)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
     book_reservations = db.relationship('BookReservation', backref='user', lazy=True)
     resource_reservations = db.relationship('ResourceReservation', backref='user', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at'),
+    )
 
 # جدول تصنيفات الكتب
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
+    # عدادات محفوظة تحدث مع كل تغيير في الكتب (counters.register_category_counters)
+    book_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    available_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # العلاقات
     books = db.relationship('Book', backref='category', lazy=True)
@@ -34,16 +41,49 @@ class Book(db.Model):
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=True)
     isbn = db.Column(db.String(20), nullable=True)
+    # مفاتيح البحث المطبعة (تحسب عند الحفظ في search.register_search_keys)
+    title_search = db.Column(db.String(200), nullable=True, index=True)
+    author_search = db.Column(db.String(100), nullable=True, index=True)
     publication_year = db.Column(db.Integer, nullable=True)
     description = db.Column(db.Text, nullable=True)
-    available = db.Column(db.Boolean, default=True)
+    available = db.Column(db.Boolean, default=True)  # يوجد نسخة واحدة متاحة على الأقل
+    # عدد النسخ الكلي والمتاح (تحدث مع حجز النسخ وإعادتها في inventory.py)
+    copies_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    available_copies = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     added_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
     reservations = db.relationship('BookReservation', backref='book', lazy=True)
+    copies = db.relationship('BookCopy', backref='book', lazy=True)
     added_by_user = db.relationship('User', foreign_keys=[added_by])
+    
+    # فهارس التصفح: حسب التصنيف، والترتيب بالعنوان والمؤلف والأحدث
+    __table_args__ = (
+        db.Index('ix_book_category_title', 'category_id', 'title'),
+        db.Index('ix_book_created_at', 'created_at'),
+        db.Index('ix_book_title', 'title'),
+        db.Index('ix_book_author', 'author'),
+        db.Index('ix_book_isbn', 'isbn'),
+    )
+
+register_search_keys(Book)
+register_category_counters(Book, Category)
+
+# جدول نسخ الكتب (المخزون): كل نسخة لها رمز شريطي وحالة
+class BookCopy(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    barcode = db.Column(db.String(50), unique=True, nullable=False)
+    condition = db.Column(db.String(20), nullable=False, default='good')  # new, good, worn, damaged
+    status = db.Column(db.String(20), nullable=False, default='available')  # available, reserved, withdrawn
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # فهرس اختيار أول نسخة متاحة للكتاب
+    __table_args__ = (
+        db.Index('ix_book_copy_book_status', 'book_id', 'status'),
+    )
 
 # جدول حجوزات الكتب
 class BookReservation(db.Model):
@@ -53,7 +93,24 @@ class BookReservation(db.Model):
     reservation_date = db.Column(db.DateTime, nullable=False)
     return_date = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='pending')  # pending, approved, returned, rejected
+    copy_id = db.Column(db.Integer, db.ForeignKey('book_copy.id'), nullable=True)  # النسخة المخصصة للحجز
+    due_date = db.Column(db.DateTime, nullable=True)  # موعد الإعادة (يحدد عند الموافقة)
+    overdue_at = db.Column(db.DateTime, nullable=True)  # وقت اكتشاف التأخير (jobs.detect_overdue)
+    renewals = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # عدد مرات تمديد الاستعارة
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    copy = db.relationship('BookCopy')
+    
+    # فهارس مسارات الحجز: عدد الكتب المعتمدة للمستخدم، حجوزاتي، وقائمة المسؤول
+    __table_args__ = (
+        db.Index('ix_book_reservation_user_status', 'user_id', 'status'),
+        db.Index('ix_book_reservation_user_created', 'user_id', 'created_at'),
+        db.Index('ix_book_reservation_status_created', 'status', 'created_at'),
+        db.Index('ix_book_reservation_created_at', 'created_at'),
+        db.Index('ix_book_reservation_status_date', 'status', 'reservation_date'),
+        db.Index('ix_book_reservation_status_due', 'status', 'due_date'),
+        db.Index('ix_book_reservation_copy_status', 'copy_id', 'status'),
+    )
 
 # جدول المختبرات وغرف المصادر
 class Resource(db.Model):
@@ -72,12 +129,68 @@ class ResourceReservation(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=False)
     reservation_date = db.Column(db.Date, nullable=False)
-    period = db.Column(db.Integer, nullable=False)  # رقم الحصة (1-8)
+    period = db.Column(db.Integer, nullable=False)  # رقم الحصة في الجدول الزمني (Period.number)
+    series_id = db.Column(db.Integer, db.ForeignKey('resource_reservation_series.id'), nullable=True)  # للحجز المتكرر
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # قيد فريد لضمان عدم تكرار الحجز لنفس المورد في نفس اليوم والحصة
     __table_args__ = (
         db.UniqueConstraint('resource_id', 'reservation_date', 'period', name='unique_resource_reservation'),
+        db.Index('ix_resource_reservation_date_resource', 'reservation_date', 'resource_id', 'period'),
+        db.Index('ix_resource_reservation_user_date', 'user_id', 'reservation_date'),
+        db.Index('ix_resource_reservation_date', 'reservation_date'),
+        db.Index('ix_resource_reservation_series', 'series_id', 'reservation_date'),
+    )
+
+# سلسلة حجز متكرر (نفس المورد والحصة كل أسبوع أو أسبوعين حتى تاريخ محدد)
+class ResourceReservationSeries(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    interval_weeks = db.Column(db.Integer, nullable=False, default=1)  # 1 أسبوعي، 2 كل أسبوعين
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    resource = db.relationship('Resource')
+    reservations = db.relationship('ResourceReservation', backref='series', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_resource_reservation_series_user', 'user_id', 'start_date'),
+    )
+
+# الجدول الزمني للحصص: صفوف اليوم العادي (weekday فارغ) وصفوف تخص يوماً معيناً
+# (مثل دوام الخميس القصير) تحل محل صفوف اليوم العادي في ذلك اليوم (timetable.get_timetable)
+class Period(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    number = db.Column(db.Integer, nullable=False)  # رقم الحصة المخزن في ResourceReservation.period
+    name = db.Column(db.String(50), nullable=True)
+    weekday = db.Column(db.Integer, nullable=True)  # 0 = الاثنين ... 6 = الأحد، فارغ لكل الأيام
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # القيد الفريد لا يمنع تكرار صفوف اليوم العادي لأن NULL لا يساوي NULL، فلها فهرس فريد جزئي
+    __table_args__ = (
+        db.UniqueConstraint('weekday', 'number', name='unique_period'),
+        db.Index('ux_period_regular_number', 'number', unique=True,
+                 sqlite_where=db.text('weekday IS NULL'), postgresql_where=db.text('weekday IS NULL')),
+    )
+
+# التقويم المدرسي: الفصول الدراسية والعطل الرسمية وأسابيع الاختبارات
+# أيام الدوام تحسب منه مرة واحدة وتخزن مؤقتاً (school_calendar.get_calendar)
+class SchoolCalendar(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='term')  # term, holiday, exam
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_school_calendar_kind_start', 'kind', 'start_date'),
     )
 
 # جدول شروط الاستعارة
@@ -86,4 +199,87 @@ class BorrowingRules(db.Model):
     max_days = db.Column(db.Integer, default=7)  # الحد الأقصى لأيام الاستعارة
     max_books = db.Column(db.Integer, default=3)  # الحد الأقصى لعدد الكتب المستعارة للشخص الواحد
     rules_text = db.Column(db.Text, nullable=True)  # نص الشروط
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # يزداد مع كل تعديل لإبطال النسخ المخزنة
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# جدول إحصائيات الاستعارة المجمعة يومياً حسب التصنيف والدور والصف
+# يحدث تدريجياً مع كل تغيير في حالة الحجز (reservation_stats.record_transition)
+class ReservationStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    role = db.Column(db.String(20), nullable=False)
+    grade = db.Column(db.String(20), nullable=False, default='')  # فارغ لغير الطلاب
+    requested = db.Column(db.Integer, nullable=False, default=0)
+    approved = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    returned = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'category_id', 'role', 'grade', name='unique_reservation_stat'),
+    )
+
+# قائمة انتظار الكتب غير المتاحة (بالترتيب حسب المعرف)
+class BookHold(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='waiting')  # waiting, ready, fulfilled, expired, cancelled
+    copy_id = db.Column(db.Integer, db.ForeignKey('book_copy.id'), nullable=True)  # النسخة المحجوزة لصاحب الدور
+    ready_until = db.Column(db.DateTime, nullable=True)  # آخر موعد لاستلام النسخة
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    book = db.relationship('Book')
+    user = db.relationship('User')
+    
+    # فهارس رأس الطابور لكل كتاب، وانتظارات المستخدم، وانتهاء صلاحية الأدوار الجاهزة
+    __table_args__ = (
+        db.Index('ix_book_hold_book_status', 'book_id', 'status', 'id'),
+        db.Index('ix_book_hold_user_status', 'user_id', 'status'),
+        db.Index('ix_book_hold_status_ready_until', 'status', 'ready_until'),
+    )
+
+# جدول المهام الخلفية (يقرأه العامل في jobs.py دون الحاجة إلى وسيط خارجي)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    unique_key = db.Column(db.String(50), nullable=True)  # للمهام الدورية: نسخة واحدة في الطابور
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # فهرس اختيار المهمة التالية المستحقة، وفهرس فريد جزئي يمنع تكرار المهمة الدورية
+    # (صف واحد في الانتظار أو قيد التنفيذ لكل مفتاح)
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        db.Index('ix_job_name_status', 'name', 'status'),
+        db.Index('ux_job_unique_key_active', 'unique_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
+    )
+
+# صندوق التنبيهات الصادرة: يكتب في نفس معاملة تغيير حالة الحجز ويرسله العامل الخلفي
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    channel = db.Column(db.String(20), nullable=False, default='in_app')  # in_app, email
+    kind = db.Column(db.String(30), nullable=False)  # requested, approved, rejected, returned, cancelled, hold_ready, overdue
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_error = db.Column(db.Text, nullable=True)
+    read_at = db.Column(db.DateTime, nullable=True)  # للتنبيهات داخل الموقع
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # فهرس اختيار الدفعة التالية للإرسال، وتنبيهات المستخدم غير المقروءة
+    __table_args__ = (
+        db.Index('ix_notification_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_notification_user_channel_read', 'user_id', 'channel', 'read_at'),
+    )
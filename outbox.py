@@ -0,0 +1,137 @@
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from sqlalchemy import select, update
+from __init__ import db
+from models import User, Notification
+
+# صندوق التنبيهات الصادرة (transactional outbox): التنبيه يضاف إلى الجلسة مع تغيير حالة
+# الحجز ويحفظ في نفس commit، فلا يضيع تنبيه ولا يرسل تنبيه لتغيير لم يحفظ.
+# الإرسال الفعلي (البريد) يتم في العامل الخلفي على دفعات مع إعادة المحاولة وتحديد المعدل،
+# فلا ينتظر طلب المسؤول أي اتصال بالشبكة
+
+NOTIFY_MAX_ATTEMPTS = 5
+
+MESSAGES = {
+    'requested': ('تم استلام طلب الحجز', 'تم استلام طلب حجز كتاب "{title}" وسيراجعه المسؤول.'),
+    'approved': ('تمت الموافقة على الحجز', 'تمت الموافقة على حجز كتاب "{title}". موعد الإعادة: {due_date}.'),
+    'rejected': ('تم رفض الحجز', 'تم رفض طلب حجز كتاب "{title}".'),
+    'returned': ('تم تسجيل الإعادة', 'تم تسجيل إعادة كتاب "{title}". شكراً لك.'),
+    'cancelled': ('تم إلغاء الحجز', 'تم إلغاء حجز كتاب "{title}".'),
+    'renewed': ('تم تمديد الاستعارة', 'تم تمديد استعارة كتاب "{title}" حتى {due_date}.'),
+    'hold_ready': ('الكتاب جاهز للاستلام', 'أصبحت نسخة من كتاب "{title}" محجوزة لك حتى {ready_until}.'),
+    'overdue': ('استعارة متأخرة', 'تأخرت إعادة كتاب "{title}" عن موعدها {due_date}. يرجى إعادته.'),
+}
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+# إضافة تنبيه داخل الموقع (يعتبر مرسلاً فور الحفظ) وآخر بالبريد إذا كان للمستخدم بريد
+def queue_notification(user, kind, **context):
+    subject, template = MESSAGES[kind]
+    body = template.format(**{key: _format(value) for key, value in context.items()})
+    now = datetime.now()
+
+    db.session.add(Notification(user_id=user.id, channel='in_app', kind=kind, subject=subject, body=body,
+                                status='sent', sent_at=now, next_attempt_at=now))
+    if user.email:
+        db.session.add(Notification(user_id=user.id, channel='email', kind=kind, subject=subject, body=body,
+                                    status='pending', next_attempt_at=now))
+
+def unread_notifications(user_id, limit=20):
+    return Notification.query.filter_by(user_id=user_id, channel='in_app', read_at=None) \
+        .order_by(Notification.id.desc()).limit(limit).all()
+
+def mark_notifications_read(user_id):
+    table = Notification.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.user_id == user_id, table.c.channel == 'in_app', table.c.read_at.is_(None))
+        .values(read_at=datetime.now())
+    )
+    db.session.commit()
+
+# حجز دفعة للإرسال بتحديث مشروط واحد؛ الدفعة المحجوزة تعود تلقائياً للطابور إذا توقف
+# العامل قبل إنهائها (next_attempt_at بعد مهلة القفل)
+def _claim_batch(limit):
+    table = Notification.__table__
+    now = datetime.now()
+    lock_until = now + timedelta(seconds=current_app.config.get('NOTIFY_LOCK_TIMEOUT', 600))
+    due = select(table.c.id) \
+        .where(table.c.status.in_(('pending', 'sending')), table.c.next_attempt_at <= now) \
+        .order_by(table.c.next_attempt_at).limit(limit)
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(due), table.c.status.in_(('pending', 'sending')))
+        .values(status='sending', attempts=table.c.attempts + 1, next_attempt_at=lock_until)
+        .returning(table.c.id, table.c.user_id, table.c.channel, table.c.subject, table.c.body, table.c.attempts)
+    ).all()
+    db.session.commit()
+    return rows
+
+class _Mailer:
+    def __init__(self, config):
+        self.config = config
+        self._smtp = None
+
+    def send(self, address, subject, body):
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.config.get('MAIL_SERVER', 'localhost'),
+                                      self.config.get('MAIL_PORT', 1025), timeout=10)
+        message = EmailMessage()
+        message['From'] = self.config.get('MAIL_SENDER', 'library@localhost')
+        message['To'] = address
+        message['Subject'] = subject
+        message.set_content(body or '')
+        self._smtp.send_message(message)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+
+# إرسال دفعة باتصال SMTP واحد دون انتظار بين الرسائل (لا يحجز خيط العامل عن المهام الأخرى).
+# تحديد المعدل بحجم الدفعة: المهمة تعمل مرة كل دقيقة وترسل NOTIFY_RATE_PER_MINUTE رسالة على الأكثر،
+# والباقي يبقى في الطابور للتشغيل التالي
+def send_pending_notifications():
+    config = current_app.config
+    rows = _claim_batch(min(config.get('NOTIFY_BATCH_SIZE', 50), config.get('NOTIFY_RATE_PER_MINUTE', 60)))
+    if not rows:
+        return 0
+
+    addresses = dict(db.session.execute(
+        select(User.id, User.email).where(User.id.in_({row.user_id for row in rows}))
+    ).all())
+    table = Notification.__table__
+    mailer = _Mailer(config)
+    sent = 0
+
+    try:
+        for row in rows:
+            try:
+                if row.channel != 'email' or not addresses.get(row.user_id):
+                    raise ValueError('قناة غير مدعومة أو لا يوجد بريد للمستخدم')
+                mailer.send(addresses[row.user_id], row.subject, row.body)
+            except (OSError, smtplib.SMTPException, ValueError) as e:
+                mailer.close()
+                mailer = _Mailer(config)
+                if row.attempts >= NOTIFY_MAX_ATTEMPTS or isinstance(e, ValueError):
+                    values = {'status': 'failed'}
+                else:
+                    values = {'status': 'pending',
+                              'next_attempt_at': datetime.now() + timedelta(minutes=2 ** row.attempts)}
+                db.session.execute(update(table).where(table.c.id == row.id).values(last_error=str(e)[:500], **values))
+            else:
+                db.session.execute(update(table).where(table.c.id == row.id)
+                                   .values(status='sent', sent_at=datetime.now(), last_error=None))
+                sent += 1
+            db.session.commit()
+    finally:
+        mailer.close()
+
+    return sent
@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import datetime, date
+from sqlalchemy import and_, or_
+
+# ترقيم الصفحات بالمفاتيح (keyset): الصفحة التالية تبدأ بعد آخر صف معروض
+# بدلاً من OFFSET، فلا يوجد COUNT(*) ولا تزداد التكلفة كلما تقدمت الصفحات
+# ترتيب الصفحة يحدد بقائمة (تعبير, تنازلي؟) ويجب أن ينتهي بعمود فريد مثل id
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': [_encode_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None, 'next'
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return [_decode_value(v) for v in payload['v']], payload['d']
+    except (ValueError, KeyError, TypeError):
+        # مؤشر تالف: نعرض الصفحة الأولى
+        return None, 'next'
+
+# شرط "بعد" قيمة واحدة مع مراعاة ترتيب SQLite للقيم الفارغة (أولاً تصاعدياً، أخيراً تنازلياً)
+def _after(expression, value, descending):
+    if value is None:
+        return expression.isnot(None) if not descending else None
+    if descending:
+        return or_(expression < value, expression.is_(None))
+    return expression > value
+
+def _equal(expression, value):
+    return expression.is_(None) if value is None else expression == value
+
+def _keyset_filter(order, values):
+    clauses = []
+    for i, (expression, descending) in enumerate(order):
+        after = _after(expression, values[i], descending)
+        if after is None:
+            continue
+        prefix = [_equal(order[j][0], values[j]) for j in range(i)]
+        clauses.append(and_(*prefix, after))
+    return or_(*clauses)
+
+class KeysetPage:
+    def __init__(self, items, per_page, has_next, has_prev, next_cursor, prev_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def keyset_paginate(query, order, cursor=None, per_page=12):
+    values, direction = decode_cursor(cursor)
+    if values is not None and len(values) != len(order):
+        values, direction = None, 'next'
+    backwards = values is not None and direction == 'prev'
+
+    # عند الرجوع للخلف نعكس الترتيب ثم نعيد ترتيب النتائج
+    effective = [(expression, descending != backwards) for expression, descending in order]
+
+    query = query.add_columns(*[expression.label('_key{}'.format(i)) for i, (expression, _) in enumerate(order)])
+    if values is not None:
+        query = query.filter(_keyset_filter(effective, values))
+    query = query.order_by(*[expression.desc() if descending else expression.asc()
+                             for expression, descending in effective])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    keys = [list(row[1:]) for row in rows]
+
+    if backwards:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = values is not None, has_more
+
+    next_cursor = encode_cursor(keys[-1], 'next') if has_next and keys else None
+    prev_cursor = encode_cursor(keys[0], 'prev') if has_prev and keys else None
+
+    return KeysetPage(items, per_page, bool(next_cursor), bool(prev_cursor), next_cursor, prev_cursor)
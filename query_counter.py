@@ -0,0 +1,60 @@
+from flask import g, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+# عداد الاستعلامات لكل طلب في وضع التطوير والاختبار
+# يسجل عدد الاستعلامات في ترويسة X-Query-Count، ويعتبر أي تحميل كسول لعلاقة
+# أثناء عرض القالب خطأ (N+1): يرفع استثناء في الاختبارات ويسجل تحذيراً في وضع التطوير
+
+class LazyLoadError(Exception):
+    pass
+
+def _active(app):
+    return has_request_context() and (app.debug or app.testing or app.config.get('QUERY_COUNTER'))
+
+def check_lazy_load(orm_execute_state):
+    if not has_request_context():
+        return
+    app = current_app._get_current_object()
+    if not _active(app) or not g.get('rendering_template'):
+        return
+    if orm_execute_state.is_relationship_load and orm_execute_state.lazy_loaded_from is not None:
+        mapper = orm_execute_state.lazy_loaded_from.mapper.class_.__name__
+        message = 'تحميل كسول لعلاقة من {} أثناء عرض القالب {}'.format(mapper, g.rendering_template)
+        if app.testing:
+            raise LazyLoadError(message)
+        app.logger.warning(message)
+
+def install_query_counter(app, db):
+    if 'query_counter' in app.extensions:
+        return
+    app.extensions['query_counter'] = True
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if _active(app):
+            g.query_count = g.get('query_count', 0) + 1
+
+    # المستمع على مصنع جلسات db.session (وليس على صنف Session العام) ويسجل مرة واحدة،
+    # فلا تتراكم المستمعات مع كل create_app في الاختبارات
+    if not event.contains(db.session, 'do_orm_execute', check_lazy_load):
+        event.listen(db.session, 'do_orm_execute', check_lazy_load)
+
+    def rendering_started(sender, template, context, **extra):
+        if has_request_context():
+            g.rendering_template = template.name or '<string>'
+
+    def rendering_finished(sender, template, context, **extra):
+        if has_request_context():
+            g.rendering_template = None
+
+    before_render_template.connect(rendering_started, app, weak=False)
+    template_rendered.connect(rendering_finished, app, weak=False)
+
+    @app.after_request
+    def add_query_count(response):
+        if _active(app):
+            response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
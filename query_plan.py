@@ -0,0 +1,60 @@
+import re
+from flask import request, has_request_context
+from sqlalchemy import event
+
+# فحص خطط الاستعلامات: يسجل لكل مسار الاستعلامات التي تمسح جدولاً كاملاً دون فهرس
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# جداول صغيرة ثابتة الحجم لا يضر مسحها بالكامل
+DEFAULT_IGNORED_TABLES = ('category', 'resource', 'borrowing_rules', 'schema_migrations', 'school_calendar', 'period')
+
+def install_scan_check(app, db):
+    if 'scan_reports' in app.extensions:
+        return app.extensions['scan_reports']
+
+    ignored = set(app.config.get('QUERY_PLAN_IGNORE', DEFAULT_IGNORED_TABLES))
+    reports = {}
+    app.extensions['scan_reports'] = reports
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def explain_query(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not has_request_context():
+            return
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return
+
+        plan = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+        for row in plan:
+            match = FULL_SCAN.match(row[-1])
+            if match and match.group(1) not in ignored:
+                endpoint = request.endpoint or request.path
+                if statement not in reports.setdefault(endpoint, []):
+                    reports[endpoint].append(statement)
+                    app.logger.warning('استعلام يمسح الجدول %s بالكامل في %s', match.group(1), endpoint)
+
+    return reports
+
+# زيارة كل مسار GET مسجل بصلاحيات المسؤول وجمع تقارير المسح الكامل
+def check_routes(app, db, user_id):
+    reports = install_scan_check(app, db)
+    client = app.test_client()
+
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint == 'static':
+            continue
+        path = rule.build({argument: 1 for argument in rule.arguments}, append_unknown=False)[1]
+
+        # إعادة تسجيل الدخول قبل كل طلب (مسار تسجيل الخروج يمسح الجلسة)
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        try:
+            client.get(path)
+        except Exception:
+            # أخطاء القوالب لا تمنع فحص الاستعلامات التي نفذت قبلها
+            pass
+
+    return reports
@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, func
+from __init__ import db
+from models import BookReservation, BookHold
+from inventory import allocate_copy, release_copies
+from rules_cache import get_borrowing_rules
+from reservation_stats import record_transition
+from outbox import queue_notification
+from school_calendar import next_open_day
+
+# حجز الكتب بشكل ذري: حجز نسخة بتحديث مشروط، ثم التحقق من حد المستخدم
+# داخل نفس المعاملة. التحديث المشروط يأخذ قفل الكتابة في SQLite، فلا يمكن لطلبين
+# متزامنين حجز نفس الكتاب، ولا يتجاوز المستخدم الحد الأقصى بطلبات متوازية
+ACTIVE_STATUSES = ('pending', 'approved')
+
+class ReservationError(Exception):
+    pass
+
+# التحقق من حد الكتب المستعارة للمستخدم (يستدعى داخل معاملة الحجز)
+def check_borrowing_limit(user):
+    max_books = get_borrowing_rules().max_books
+    active_reservations = db.session.execute(
+        select(func.count(BookReservation.id))
+        .where(BookReservation.user_id == user.id, BookReservation.status.in_(ACTIVE_STATUSES))
+    ).scalar()
+
+    if active_reservations >= max_books:
+        raise ReservationError(f'لا يمكنك استعارة أكثر من {max_books} كتب في نفس الوقت')
+
+def reserve_book_atomically(user, book, reservation_date):
+    taken = allocate_copy(book.id)
+
+    if taken is None:
+        db.session.rollback()
+        raise ReservationError('هذا الكتاب غير متاح للحجز حالياً')
+
+    try:
+        check_borrowing_limit(user)
+    except ReservationError:
+        db.session.rollback()
+        raise
+
+    category_id, copy_id = taken
+    reservation = BookReservation(
+        user_id=user.id,
+        book_id=book.id,
+        copy_id=copy_id,
+        reservation_date=reservation_date,
+        status='pending'
+    )
+    db.session.add(reservation)
+    record_transition(reservation, 'requested', book=book, user=user)
+    queue_notification(user, 'requested', title=book.title)
+    db.session.commit()
+
+    return reservation
+
+# إعارة مباشرة من مكتب الإعارة: حجز نسخة (محددة بالرمز الشريطي أو أي نسخة متاحة)
+# واعتمادها فوراً مع موعد الإعادة، في معاملة واحدة
+def checkout_copy(user, book, copy_id=None):
+    taken = allocate_copy(book.id, copy_id)
+
+    if taken is None:
+        db.session.rollback()
+        raise ReservationError('لا توجد نسخة متاحة من هذا الكتاب' if copy_id is None else 'هذه النسخة غير متاحة')
+
+    try:
+        check_borrowing_limit(user)
+    except ReservationError:
+        db.session.rollback()
+        raise
+
+    now = datetime.now()
+    reservation = BookReservation(
+        user_id=user.id,
+        book_id=book.id,
+        copy_id=taken[1],
+        reservation_date=now,
+        due_date=compute_due_date(now, get_borrowing_rules().max_days),
+        status='approved'
+    )
+    db.session.add(reservation)
+    record_transition(reservation, 'requested', book=book, user=user)
+    record_transition(reservation, 'approved', book=book, user=user)
+    queue_notification(user, 'approved', title=book.title, due_date=reservation.due_date)
+    db.session.commit()
+
+    return reservation
+
+# استلام كتاب من قائمة الانتظار: النسخة محجوزة مسبقاً لصاحب الدور
+def claim_hold(user, hold):
+    # تحديث مشروط واحد: لا يستلم نفس الدور مرتين (نقر مزدوج أو نافذتان) ولا يستلم دور انتهت مهلته
+    hold_table = BookHold.__table__
+    claimed = db.session.execute(
+        update(hold_table)
+        .where(hold_table.c.id == hold.id, hold_table.c.user_id == user.id,
+               hold_table.c.status == 'ready', hold_table.c.ready_until >= datetime.now())
+        .values(status='fulfilled')
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        raise ReservationError('لا توجد نسخة جاهزة لك من هذا الكتاب')
+
+    try:
+        check_borrowing_limit(user)
+    except ReservationError:
+        db.session.rollback()
+        raise
+
+    reservation = BookReservation(
+        user_id=user.id,
+        book_id=hold.book_id,
+        copy_id=hold.copy_id,
+        reservation_date=datetime.now(),
+        status='pending'
+    )
+    db.session.add(reservation)
+    db.session.expire(hold, ['status'])
+    record_transition(reservation, 'requested', book=hold.book, user=user)
+    queue_notification(user, 'requested', title=hold.book.title)
+    db.session.commit()
+
+    return reservation
+
+# تغيير حالة حجز واحد بنفس التحديث المشروط للإجراءات الجماعية (BULK_ACTIONS): لا يتغير الحجز
+# إلا من الحالات المسموحة، وتعاد النسخة ويسجل التغيير ويرسل الإشعار فقط إذا تغير الصف فعلاً،
+# فلا يعيد النقر المزدوج أو طلبان متزامنان نفس النسخة مرتين
+def transition_loan(reservation, action):
+    # استيراد متأخر: bulk_reservations يستورد compute_due_date من هذه الوحدة
+    from bulk_reservations import bulk_transition
+    if bulk_transition(action, [reservation.id])[reservation.id] != 'ok':
+        raise ReservationError('لا يمكن تنفيذ هذا الإجراء على الحجز في حالته الحالية')
+
+# اعتماد حجز قائم وتحديد موعد الإعادة
+def approve_loan(reservation):
+    transition_loan(reservation, 'approve')
+
+def reject_loan(reservation):
+    transition_loan(reservation, 'reject')
+
+# تسجيل إعادة الكتاب: النسخة تعود للرف أو لأول منتظر
+def return_loan(reservation):
+    transition_loan(reservation, 'return')
+
+# إلغاء الطالب لحجزه: الحجوزات قيد الانتظار فقط، بحذف مشروط بالحالة
+def cancel_loan(reservation):
+    table = BookReservation.__table__
+    book, user = reservation.book, reservation.user
+    cancelled = db.session.execute(
+        delete(table)
+        .where(table.c.id == reservation.id, table.c.status == 'pending')
+        .returning(table.c.book_id, table.c.copy_id)
+    ).first()
+    if cancelled is None:
+        db.session.rollback()
+        raise ReservationError('يمكن إلغاء الحجوزات قيد الانتظار فقط')
+
+    release_copies([(cancelled.book_id, cancelled.copy_id)])
+    record_transition(reservation, 'cancelled', book=book, user=user)
+    queue_notification(user, 'cancelled', title=book.title)
+    db.session.expunge(reservation)
+    db.session.commit()
+
+# موعد الإعادة: بعد max_days من البداية، ويؤجل إلى أول يوم عمل إذا وقع في العطلة
+def compute_due_date(start, max_days):
+    return next_open_day(start + timedelta(days=max_days))
+
+# تمديد الاستعارة: مرات محدودة (MAX_RENEWALS) وبشرط عدم وجود منتظرين للكتاب
+def renew_reservation(reservation):
+    if reservation.status != 'approved':
+        raise ReservationError('يمكن تمديد الاستعارات المعتمدة فقط')
+
+    max_renewals = current_app.config.get('MAX_RENEWALS', 1)
+    if reservation.renewals >= max_renewals:
+        raise ReservationError('تم تمديد هذه الاستعارة بالحد الأقصى المسموح')
+
+    waiting = db.session.execute(
+        select(BookHold.id).where(BookHold.book_id == reservation.book_id, BookHold.status == 'waiting').limit(1)
+    ).first()
+    if waiting:
+        raise ReservationError('لا يمكن التمديد لوجود طلبات انتظار على هذا الكتاب')
+
+    # التمديد يبدأ من موعد الإعادة الحالي، أو من اليوم إذا كانت الاستعارة متأخرة
+    start = max(reservation.due_date or datetime.now(), datetime.now())
+    reservation.due_date = compute_due_date(start, get_borrowing_rules().max_days)
+    reservation.renewals += 1
+    reservation.overdue_at = None
+    queue_notification(reservation.user, 'renewed', title=reservation.book.title, due_date=reservation.due_date)
+    db.session.commit()
+
+    return reservation
@@ -0,0 +1,84 @@
+from collections import Counter
+from datetime import date
+from sqlalchemy import select, func, case, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from __init__ import db
+from models import User, Book, BookReservation, ReservationStat
+
+# إحصائيات الاستعارة المجمعة: كل تغيير في حالة الحجز يزيد عداداً واحداً في صف اليوم
+# المطابق (التاريخ، التصنيف، الدور، الصف) داخل نفس معاملة التغيير
+TRANSITIONS = ('requested', 'approved', 'rejected', 'returned', 'cancelled')
+REPORT_DIMENSIONS = ('category_id', 'role', 'grade')
+
+def _upsert(day, category_id, role, grade, counts):
+    table = ReservationStat.__table__
+    values = {name: counts.get(name, 0) for name in TRANSITIONS}
+    statement = sqlite_insert(table).values(day=day, category_id=category_id, role=role, grade=grade or '', **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=['day', 'category_id', 'role', 'grade'],
+        set_={name: table.c[name] + statement.excluded[name] for name in TRANSITIONS}
+    )
+    db.session.execute(statement)
+
+# يستدعى فقط بعد تحديث مشروط غير حالة الحجز فعلاً، وإلا يحسب الإجراء المكرر مرتين
+def record_transition(reservation, transition, book=None, user=None):
+    book = book or reservation.book
+    user = user or reservation.user
+    _upsert(date.today(), book.category_id, user.role, user.grade, {transition: 1})
+
+# تسجيل نفس التغيير لمجموعة حجوزات: صف واحد لكل (تصنيف، دور، صف) بدلاً من صف لكل حجز
+# (الحجوزات محملة مع الكتاب والمستخدم)
+def record_transitions(reservations, transition):
+    groups = Counter((r.book.category_id, r.user.role, r.user.grade) for r in reservations)
+    for (category_id, role, grade), count in groups.items():
+        _upsert(date.today(), category_id, role, grade, {transition: count})
+
+# إعادة بناء الإحصائيات من سجل الحجوزات
+# السجل لا يحفظ تاريخ الموافقة أو الرفض، فتنسب إلى يوم الطلب، والإعادة إلى يوم الإعادة،
+# والحجوزات الملغاة محذوفة من السجل فلا يمكن استرجاعها
+def backfill_reservation_stats():
+    day = func.date(BookReservation.created_at)
+    returned_day = func.date(BookReservation.return_date)
+    dimensions = (Book.category_id, User.role, User.grade)
+
+    requested = db.session.execute(
+        select(day, *dimensions,
+               func.count(),
+               func.sum(case((BookReservation.status.in_(('approved', 'returned')), 1), else_=0)),
+               func.sum(case((BookReservation.status == 'rejected', 1), else_=0)))
+        .join(Book, Book.id == BookReservation.book_id)
+        .join(User, User.id == BookReservation.user_id)
+        .group_by(day, *dimensions)
+    ).all()
+
+    returned = db.session.execute(
+        select(returned_day, *dimensions, func.count())
+        .join(Book, Book.id == BookReservation.book_id)
+        .join(User, User.id == BookReservation.user_id)
+        .where(BookReservation.status == 'returned', BookReservation.return_date.isnot(None))
+        .group_by(returned_day, *dimensions)
+    ).all()
+
+    db.session.execute(delete(ReservationStat))
+    for row_day, category_id, role, grade, total, approved, rejected in requested:
+        _upsert(date.fromisoformat(row_day), category_id, role, grade,
+                {'requested': total, 'approved': approved or 0, 'rejected': rejected or 0})
+    for row_day, category_id, role, grade, total in returned:
+        _upsert(date.fromisoformat(row_day), category_id, role, grade, {'returned': total})
+    db.session.commit()
+
+    return len(requested) + len(returned)
+
+# تقرير الاستعارة لفترة: تجميع يومي أو أسبوعي حسب بعد واحد (category_id أو role أو grade)
+def borrowing_report(start, end, period='day', by='category_id'):
+    if by not in REPORT_DIMENSIONS:
+        by = 'category_id'
+    bucket = ReservationStat.day if period == 'day' else func.strftime('%Y-%W', ReservationStat.day)
+    dimension = getattr(ReservationStat, by)
+    return db.session.execute(
+        select(bucket.label('period'), dimension.label(by),
+               *[func.sum(getattr(ReservationStat, name)).label(name) for name in TRANSITIONS])
+        .where(ReservationStat.day >= start, ReservationStat.day <= end)
+        .group_by(bucket, dimension)
+        .order_by(bucket, dimension)
+    ).all()
@@ -0,0 +1,122 @@
+from datetime import date, timedelta
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import IntegrityError
+from __init__ import db
+from models import ResourceReservation, ResourceReservationSeries
+from school_calendar import get_calendar
+
+# الحجز المتكرر للمختبرات: المعلم يحجز نفس المورد والحصة كل أسبوع (أو كل أسبوعين) حتى تاريخ محدد.
+# كل تواريخ السلسلة تحسب في الذاكرة، ثم يكشف التعارض مع القيد الفريد
+# (المورد، التاريخ، الحصة) باستعلام واحد على كل التواريخ، وتدرج السلسلة كاملة في معاملة واحدة
+
+SERIES_INTERVALS = (1, 2)
+
+# أطول سلسلة مسموحة (فصل دراسي تقريباً)
+MAX_SERIES_DAYS = 200
+
+class SeriesConflict(Exception):
+    def __init__(self, dates):
+        super().__init__('المورد محجوز في بعض تواريخ السلسلة')
+        self.dates = dates
+
+# هل الخطأ انتهاك للقيد الفريد (المورد، التاريخ، الحصة)؟ أي خطأ سلامة آخر لا يعتبر تعارضاً
+# (SQLite يذكر أعمدة القيد في الرسالة، وقواعد البيانات الأخرى تذكر اسمه)
+def is_slot_conflict(error):
+    message = str(error.orig)
+    return 'unique_resource_reservation' in message or (
+        'UNIQUE' in message and 'resource_reservation.resource_id' in message)
+
+# هل الخطأ انتهاك لمفتاح أجنبي (مثل مورد غير موجود)؟ SQLite لا يذكر الجدول في الرسالة
+def is_missing_reference(error):
+    return 'FOREIGN KEY' in str(error.orig)
+
+# حجز حصة واحدة بالإدراج مباشرة: القيد الفريد هو الذي يكشف التعارض، فلا يوجد استعلام فحص
+# قبل الإدراج ولا نافذة بين الفحص والإدراج يدخل فيها طلب متزامن. يرجع None إذا كانت الحصة محجوزة،
+# ويرفع IntegrityError لأي خطأ آخر (مثل مورد غير موجود)
+def reserve_slot(user, resource_id, reservation_date, period):
+    reservation = ResourceReservation(user_id=user.id, resource_id=resource_id,
+                                      reservation_date=reservation_date, period=period)
+    db.session.add(reservation)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not is_slot_conflict(e):
+            raise
+        return None
+    return reservation
+
+def series_dates(start, until, interval_weeks=1):
+    if interval_weeks not in SERIES_INTERVALS:
+        raise ValueError('فاصل التكرار غير مدعوم')
+    until = min(until, start + timedelta(days=MAX_SERIES_DAYS))
+    calendar = get_calendar()
+    dates = []
+    day = start
+    while day <= until:
+        if calendar.is_open(day):
+            dates.append(day)
+        day += timedelta(weeks=interval_weeks)
+    return dates
+
+# التواريخ المحجوزة مسبقاً لهذا المورد والحصة من بين تواريخ السلسلة (استعلام واحد)
+def find_conflicts(resource_id, period, dates):
+    if not dates:
+        return []
+    return sorted(db.session.execute(
+        select(ResourceReservation.reservation_date)
+        .where(ResourceReservation.resource_id == resource_id,
+               ResourceReservation.period == period,
+               ResourceReservation.reservation_date.in_(dates))
+    ).scalars())
+
+# إنشاء السلسلة؛ عند التعارض ترفع SeriesConflict بكل التواريخ المتعارضة دون حفظ أي حجز،
+# إلا إذا طلب تخطي التواريخ المتعارضة وحجز الباقي
+def create_series(user, resource_id, period, start, until, interval_weeks=1, skip_conflicts=False):
+    dates = series_dates(start, until, interval_weeks)
+    if not dates:
+        raise SeriesConflict([])
+
+    conflicts = find_conflicts(resource_id, period, dates)
+    if conflicts and not skip_conflicts:
+        raise SeriesConflict(conflicts)
+    taken = set(conflicts)
+    dates = [day for day in dates if day not in taken]
+    if not dates:
+        raise SeriesConflict(conflicts)
+
+    series = ResourceReservationSeries(user_id=user.id, resource_id=resource_id, period=period,
+                                       start_date=dates[0], end_date=dates[-1], interval_weeks=interval_weeks)
+    db.session.add(series)
+    db.session.flush()
+
+    try:
+        db.session.execute(insert(ResourceReservation), [
+            {'user_id': user.id, 'resource_id': resource_id, 'reservation_date': day,
+             'period': period, 'series_id': series.id}
+            for day in dates
+        ])
+        db.session.commit()
+    except IntegrityError as e:
+        # حجز متزامن أخذ أحد التواريخ بعد الفحص: لا يحفظ شيء من السلسلة
+        db.session.rollback()
+        if not is_slot_conflict(e):
+            raise
+        raise SeriesConflict(find_conflicts(resource_id, period, dates))
+
+    return series, conflicts
+
+# إلغاء حجوزات السلسلة من تاريخ معين (اليوم افتراضياً) بحذف واحد
+def cancel_series(series, from_date=None):
+    from_date = from_date or date.today()
+    table = ResourceReservation.__table__
+    deleted = db.session.execute(
+        delete(table).where(table.c.series_id == series.id, table.c.reservation_date >= from_date)
+    ).rowcount
+    # لم يبق من السلسلة أي حجز
+    if from_date <= series.start_date:
+        db.session.delete(series)
+    else:
+        series.end_date = min(series.end_date, from_date - timedelta(days=1))
+    db.session.commit()
+    return deleted
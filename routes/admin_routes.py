@@ -1,10 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, Response, stream_with_context, send_file, jsonify
 from flask_login import login_required, current_user
-from models import User, Book, Category, BookReservation, Resource, ResourceReservation, BorrowingRules
-from admin_forms import UserForm, BookForm, CategoryForm, BorrowingRulesForm
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import User, Book, BookCopy, BookHold, Category, BookReservation, Resource, ResourceReservation, ResourceReservationSeries, BorrowingRules, Notification, SchoolCalendar, Period
+from admin_forms import UserForm, BookForm, CatalogImportForm, CategoryForm, BorrowingRulesForm, SchoolCalendarForm, PeriodForm
+from datetime import datetime, timedelta
 from __init__ import db
 from functools import wraps
+import tempfile
+from pagination import keyset_paginate
+from rules_cache import invalidate_borrowing_rules
+from school_calendar import invalidate_calendar, CALENDAR_KINDS
+from timetable import invalidate_timetable, WEEKDAY_NAMES
+from cache import invalidate_pages
+from dashboard_stats import get_dashboard_stats
+from reservation_stats import borrowing_report, REPORT_DIMENSIONS
+from inventory import add_copies
+from holds import cancel_hold, ACTIVE_HOLD_STATUSES
+from reservation_engine import approve_loan, reject_loan, return_loan, renew_reservation, ReservationError
+from catalog_import import open_reader, import_catalog
+from bulk_reservations import BULK_ACTIONS, bulk_transition
+from catalog_export import EXPORTS, EXPORT_FORMATS, export_rows, iter_csv, iter_jsonl, write_excel, parse_export_filters, export_filename
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -21,16 +37,12 @@ def admin_required(f):
 @admin_bp.route('/')
 @admin_required
 def dashboard():
-    # إحصائيات عامة
-    stats = {
-        'users_count': User.query.count(),
-        'books_count': Book.query.count(),
-        'categories_count': Category.query.count(),
-        'reservations_count': BookReservation.query.count()
-    }
+    # إحصائيات عامة (استعلام واحد مخزن لمدة قصيرة)
+    stats = get_dashboard_stats()
     
     # آخر النشاطات
-    recent_reservations = BookReservation.query.order_by(BookReservation.created_at.desc()).limit(5).all()
+    recent_reservations = BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book)) \
+        .order_by(BookReservation.created_at.desc()).limit(5).all()
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
@@ -43,10 +55,13 @@ def dashboard():
 @admin_bp.route('/users')
 @admin_required
 def users():
-    users = User.query.all()
+    # صفحات بمؤشر على فهرس تاريخ الإنشاء بدلاً من تحميل كل المستخدمين
+    users = keyset_paginate(User.query, [(User.created_at, True), (User.id, True)],
+                            cursor=request.args.get('cursor'), per_page=20)
     return render_template('admin/users.html', 
                           active_tab='users',
                           users=users,
+                          pagination=users,
                           current_year=datetime.now().year)
 
 @admin_bp.route('/users/edit/<int:user_id>', methods=['GET', 'POST'])
@@ -59,6 +74,7 @@ def edit_user(user_id):
         user.name = form.name.data
         user.role = form.role.data
         user.grade = form.grade.data if form.grade.data != 'none' else None
+        user.email = form.email.data or None
         
         if form.password.data:
             user.password = generate_password_hash(form.password.data)
@@ -89,6 +105,18 @@ def delete_user(user_id):
         flash('لا يمكن حذف المستخدم لأنه مرتبط بحجوزات', 'danger')
         return redirect(url_for('admin.users'))
     
+    # قيود المفاتيح الأجنبية مفعلة، فيتحقق من الكتب التي أضافها وسلاسل الحجز المتكرر قبل أي تعديل
+    if Book.query.filter_by(added_by=user.id).first() or ResourceReservationSeries.query.filter_by(user_id=user.id).first():
+        flash('لا يمكن حذف المستخدم لأنه أضاف كتباً أو له حجوزات متكررة', 'danger')
+        return redirect(url_for('admin.users'))
+    
+    # إلغاء أدوار الانتظار النشطة أولاً حتى تمرر النسخة المخصصة لدور جاهز إلى التالي أو تعود للرف
+    for hold in BookHold.query.filter(BookHold.user_id == user.id, BookHold.status.in_(ACTIVE_HOLD_STATUSES)) \
+            .order_by(BookHold.id).all():
+        cancel_hold(hold)
+    
+    Notification.query.filter_by(user_id=user.id).delete()
+    BookHold.query.filter_by(user_id=user.id).delete()
     db.session.delete(user)
     db.session.commit()
     
@@ -98,11 +126,13 @@ def delete_user(user_id):
 @admin_bp.route('/books')
 @admin_required
 def books():
-    page = request.args.get('page', 1, type=int)
-    books = Book.query.order_by(Book.created_at.desc()).paginate(page=page, per_page=10)
+    cursor = request.args.get('cursor')
+    books = keyset_paginate(Book.query.options(joinedload(Book.category)),
+                            [(Book.created_at, True), (Book.id, True)], cursor=cursor, per_page=10)
     return render_template('admin/books.html', 
                           active_tab='books',
                           books=books,
+                          pagination=books,
                           current_year=datetime.now().year)
 
 @admin_bp.route('/books/add', methods=['GET', 'POST'])
@@ -123,7 +153,10 @@ def add_book():
         )
         
         db.session.add(book)
+        db.session.flush()
+        add_copies(book, form.copies_to_add.data or 1)
         db.session.commit()
+        invalidate_pages('catalog')
         
         flash('تمت إضافة الكتاب بنجاح', 'success')
         return redirect(url_for('admin.books'))
@@ -140,6 +173,10 @@ def edit_book(book_id):
     form = BookForm(obj=book)
     form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
     
+    # عند التعديل لا تضاف نسخ إلا إذا طلبها المسؤول
+    if request.method == 'GET':
+        form.copies_to_add.data = 0
+    
     if form.validate_on_submit():
         book.title = form.title.data
         book.author = form.author.data
@@ -148,7 +185,11 @@ def edit_book(book_id):
         book.description = form.description.data
         book.category_id = form.category_id.data
         
+        if form.copies_to_add.data:
+            add_copies(book, form.copies_to_add.data)
+        
         db.session.commit()
+        invalidate_pages('catalog')
         
         flash('تم تحديث الكتاب بنجاح', 'success')
         return redirect(url_for('admin.books'))
@@ -169,12 +210,39 @@ def delete_book(book_id):
         flash('لا يمكن حذف الكتاب لأنه مرتبط بحجوزات', 'danger')
         return redirect(url_for('admin.books'))
     
+    BookHold.query.filter_by(book_id=book.id).delete()
+    BookCopy.query.filter_by(book_id=book.id).delete()
     db.session.delete(book)
     db.session.commit()
+    invalidate_pages('catalog')
     
     flash('تم حذف الكتاب بنجاح', 'success')
     return redirect(url_for('admin.books'))
 
+@admin_bp.route('/books/import', methods=['GET', 'POST'])
+@admin_required
+def import_books():
+    form = CatalogImportForm()
+    result = None
+    
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            result = import_catalog(open_reader(upload.stream, upload.filename), current_user.id,
+                                    create_categories=form.create_categories.data)
+        except (ValueError, ImportError) as e:
+            db.session.rollback()
+            flash(f'تعذر قراءة الملف: {e}', 'danger')
+        else:
+            invalidate_pages('catalog')
+            flash(f'تم استيراد {result.inserted} كتاب ({result.copies} نسخة)، وتخطي {result.skipped} صف', 'success')
+    
+    return render_template('admin/import_books.html', 
+                          active_tab='import_books',
+                          form=form,
+                          result=result,
+                          current_year=datetime.now().year)
+
 @admin_bp.route('/categories')
 @admin_required
 def categories():
@@ -197,6 +265,7 @@ def add_category():
         
         db.session.add(category)
         db.session.commit()
+        invalidate_pages('catalog')
         
         flash('تمت إضافة التصنيف بنجاح', 'success')
         return redirect(url_for('admin.categories'))
@@ -217,6 +286,7 @@ def edit_category(category_id):
         category.description = form.description.data
         
         db.session.commit()
+        invalidate_pages('catalog')
         
         flash('تم تحديث التصنيف بنجاح', 'success')
         return redirect(url_for('admin.categories'))
@@ -232,13 +302,20 @@ def edit_category(category_id):
 def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     
-    # التحقق من عدم وجود كتب مرتبطة بالتصنيف
-    if category.books:
+    # التحقق من عدم وجود كتب مرتبطة بالتصنيف من جدول الكتب نفسه (العداد للعرض فقط)
+    if Book.query.filter_by(category_id=category.id).first():
         flash('لا يمكن حذف التصنيف لأنه مرتبط بكتب', 'danger')
         return redirect(url_for('admin.categories'))
     
+    # قيد المفتاح الأجنبي يمنع حذف تصنيف له إحصائيات استعارة
     db.session.delete(category)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('لا يمكن حذف التصنيف لأنه مرتبط بإحصائيات الاستعارة', 'danger')
+        return redirect(url_for('admin.categories'))
+    invalidate_pages('catalog')
     
     flash('تم حذف التصنيف بنجاح', 'success')
     return redirect(url_for('admin.categories'))
@@ -246,18 +323,20 @@ def delete_category(category_id):
 @admin_bp.route('/reservations')
 @admin_required
 def reservations():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     status = request.args.get('status', '')
     
-    # بناء الاستعلام
-    reservations_query = BookReservation.query
+    # بناء الاستعلام (مع تحميل المستخدم والكتاب لكل صف)
+    reservations_query = BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book))
     
     # تطبيق فلتر الحالة إذا وجد
     if status:
         reservations_query = reservations_query.filter_by(status=status)
     
     # تنفيذ الاستعلام مع الصفحات
-    reservations = reservations_query.order_by(BookReservation.created_at.desc()).paginate(page=page, per_page=10)
+    reservations = keyset_paginate(reservations_query,
+                                   [(BookReservation.created_at, True), (BookReservation.id, True)],
+                                   cursor=cursor, per_page=10)
     
     return render_template('admin/reservations.html', 
                           active_tab='reservations',
@@ -270,12 +349,13 @@ def reservations():
 def approve_reservation(reservation_id):
     reservation = BookReservation.query.get_or_404(reservation_id)
     
-    # تحديث حالة الحجز
-    reservation.status = 'approved'
-    
-    db.session.commit()
-    
-    flash('تم الموافقة على الحجز بنجاح', 'success')
+    # تحديث حالة الحجز وتحديد موعد الإعادة
+    try:
+        approve_loan(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash('تم الموافقة على الحجز بنجاح', 'success')
     return redirect(url_for('admin.reservations'))
 
 @admin_bp.route('/reservations/reject/<int:reservation_id>', methods=['POST'])
@@ -283,16 +363,13 @@ def approve_reservation(reservation_id):
 def reject_reservation(reservation_id):
     reservation = BookReservation.query.get_or_404(reservation_id)
     
-    # تحديث حالة الحجز
-    reservation.status = 'rejected'
-    
-    # إعادة الكتاب إلى حالة متاح
-    book = Book.query.get(reservation.book_id)
-    book.available = True
-    
-    db.session.commit()
-    
-    flash('تم رفض الحجز بنجاح', 'success')
+    # تحديث حالة الحجز وإعادة نسخة الكتاب إلى الرف
+    try:
+        reject_loan(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash('تم رفض الحجز بنجاح', 'success')
     return redirect(url_for('admin.reservations'))
 
 @admin_bp.route('/reservations/return/<int:reservation_id>', methods=['POST'])
@@ -300,27 +377,84 @@ def reject_reservation(reservation_id):
 def return_book(reservation_id):
     reservation = BookReservation.query.get_or_404(reservation_id)
     
-    # تحديث حالة الحجز
-    reservation.status = 'returned'
-    reservation.return_date = datetime.now()
-    
-    # إعادة الكتاب إلى حالة متاح
-    book = Book.query.get(reservation.book_id)
-    book.available = True
-    
-    db.session.commit()
-    
-    flash('تم تسجيل إعادة الكتاب بنجاح', 'success')
+    # إعادة نسخة الكتاب وتحديث حالة الحجز
+    try:
+        return_loan(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash('تم تسجيل إعادة الكتاب بنجاح', 'success')
     return redirect(url_for('admin.reservations'))
 
+# إجراء جماعي على قائمة معرفات (ids) أو على كل الحجوزات بحالة معينة (status)
+# يرجع JSON بنتيجة كل معرف للطلبات من نوع JSON، وإلا رسالة ملخصة
+@admin_bp.route('/reservations/bulk/<action>', methods=['POST'])
+@admin_required
+def bulk_reservations(action):
+    if action not in BULK_ACTIONS:
+        abort(404)
+    
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') or request.form.getlist('ids')
+    status = data.get('status') or request.form.get('status')
+    
+    try:
+        ids = [int(reservation_id) for reservation_id in ids]
+    except (TypeError, ValueError):
+        abort(400)
+    if not ids and status:
+        ids = db.session.execute(db.select(BookReservation.id).filter_by(status=status)).scalars().all()
+    
+    results = bulk_transition(action, ids) if ids else {}
+    succeeded = sum(1 for result in results.values() if result == 'ok')
+    
+    if request.is_json:
+        return jsonify({'results': {str(k): v for k, v in results.items()},
+                        'succeeded': succeeded,
+                        'failed': len(results) - succeeded})
+    
+    flash(f'تم تنفيذ الإجراء على {succeeded} حجز من {len(results)}', 'success' if succeeded else 'warning')
+    return redirect(url_for('admin.reservations', status=request.args.get('status', '')))
+
+@admin_bp.route('/reservations/renew/<int:reservation_id>', methods=['POST'])
+@admin_required
+def renew_book(reservation_id):
+    reservation = BookReservation.query.get_or_404(reservation_id)
+    
+    try:
+        renew_reservation(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'تم تمديد الاستعارة حتى {reservation.due_date.strftime("%Y-%m-%d")}', 'success')
+    return redirect(request.referrer or url_for('admin.reservations'))
+
+# الاستعارات المتأخرة: تقرأ من فهرس (الحالة، موعد الإعادة) بالترتيب الأقدم أولاً
+@admin_bp.route('/overdue')
+@admin_required
+def overdue():
+    cursor = request.args.get('cursor')
+    overdue_query = BookReservation.query.options(joinedload(BookReservation.user), joinedload(BookReservation.book)) \
+        .filter(BookReservation.status == 'approved', BookReservation.due_date < datetime.now())
+    reservations = keyset_paginate(overdue_query,
+                                   [(BookReservation.due_date, False), (BookReservation.id, False)],
+                                   cursor=cursor, per_page=20)
+    
+    return render_template('admin/overdue.html', 
+                          active_tab='overdue',
+                          reservations=reservations,
+                          pagination=reservations,
+                          now=datetime.now(),
+                          current_year=datetime.now().year)
+
 @admin_bp.route('/resource_reservations')
 @admin_required
 def resource_reservations():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     date_str = request.args.get('date', '')
     
-    # بناء الاستعلام
-    reservations_query = ResourceReservation.query
+    # بناء الاستعلام (مع تحميل المستخدم والمورد لكل صف)
+    reservations_query = ResourceReservation.query.options(joinedload(ResourceReservation.user), joinedload(ResourceReservation.resource))
     
     # تطبيق فلتر التاريخ إذا وجد
     if date_str:
@@ -331,7 +465,9 @@ def resource_reservations():
             pass
     
     # تنفيذ الاستعلام مع الصفحات
-    reservations = reservations_query.order_by(ResourceReservation.reservation_date.desc()).paginate(page=page, per_page=10)
+    reservations = keyset_paginate(reservations_query,
+                                   [(ResourceReservation.reservation_date, True), (ResourceReservation.id, True)],
+                                   cursor=cursor, per_page=10)
     
     return render_template('admin/resource_reservations.html', 
                           active_tab='resource_reservations',
@@ -339,6 +475,75 @@ def resource_reservations():
                           pagination=reservations,
                           current_year=datetime.now().year)
 
+@admin_bp.route('/reports')
+@admin_required
+def reports():
+    today = datetime.now().date()
+    period = request.args.get('period', 'day')
+    by = request.args.get('by', 'category_id')
+    
+    # الفترة الافتراضية: آخر 30 يوماً
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = today - timedelta(days=30)
+    try:
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end = today
+    
+    rows = borrowing_report(start, end, period=period, by=by)
+    categories = {c.id: c.name for c in Category.query.all()}
+    
+    return render_template('admin/reports.html', 
+                          active_tab='reports',
+                          rows=rows,
+                          by=by if by in REPORT_DIMENSIONS else 'category_id',
+                          period=period,
+                          start=start,
+                          end=end,
+                          categories=categories,
+                          current_year=datetime.now().year)
+
+@admin_bp.route('/export')
+@admin_required
+def export():
+    categories = Category.query.order_by(Category.name).all()
+    return render_template('admin/export.html', 
+                          active_tab='export',
+                          datasets=EXPORTS.keys(),
+                          formats=EXPORT_FORMATS,
+                          categories=categories,
+                          current_year=datetime.now().year)
+
+# تنزيل التصدير: CSV و JSON Lines يبثان على دفعات، و Excel يكتب إلى ملف مؤقت ثم يرسل
+@admin_bp.route('/export/<dataset>')
+@admin_required
+def export_download(dataset):
+    export_format = request.args.get('format', 'csv')
+    if dataset not in EXPORTS or export_format not in EXPORT_FORMATS:
+        abort(404)
+    
+    columns, rows = export_rows(dataset, parse_export_filters(request.args))
+    filename = export_filename(dataset, export_format)
+    
+    if export_format == 'xlsx':
+        stream = tempfile.TemporaryFile()
+        try:
+            write_excel(columns, rows, stream)
+        except ImportError:
+            stream.close()
+            flash('تصدير Excel يتطلب تثبيت مكتبة openpyxl', 'danger')
+            return redirect(url_for('admin.export'))
+        stream.seek(0)
+        return send_file(stream, as_attachment=True, download_name=filename,
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    
+    chunks = iter_csv(columns, rows) if export_format == 'csv' else iter_jsonl(columns, rows)
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @admin_bp.route('/borrowing_rules', methods=['GET', 'POST'])
 @admin_required
 def borrowing_rules():
@@ -356,7 +561,9 @@ def borrowing_rules():
         rules.max_books = form.max_books.data
         rules.rules_text = form.rules_text.data
         
+        invalidate_borrowing_rules(rules)
         db.session.commit()
+        invalidate_pages('catalog')
         
         flash('تم تحديث شروط الاستعارة بنجاح', 'success')
         return redirect(url_for('admin.borrowing_rules'))
@@ -366,3 +573,90 @@ def borrowing_rules():
                           form=form,
                           rules=rules,
                           current_year=datetime.now().year)
+
+# التقويم المدرسي: الفصول الدراسية والعطل وأسابيع الاختبارات
+@admin_bp.route('/calendar', methods=['GET', 'POST'])
+@admin_required
+def school_calendar():
+    form = SchoolCalendarForm()
+    
+    if form.validate_on_submit():
+        entry = SchoolCalendar(
+            name=form.name.data,
+            kind=form.kind.data,
+            start_date=form.start_date.data,
+            end_date=form.end_date.data
+        )
+        db.session.add(entry)
+        db.session.commit()
+        invalidate_calendar()
+        
+        flash('تمت الإضافة إلى التقويم بنجاح', 'success')
+        return redirect(url_for('admin.school_calendar'))
+    
+    entries = SchoolCalendar.query.order_by(SchoolCalendar.start_date.desc()).all()
+    
+    return render_template('admin/calendar.html', 
+                          active_tab='calendar',
+                          form=form,
+                          entries=entries,
+                          kinds=CALENDAR_KINDS,
+                          current_year=datetime.now().year)
+
+@admin_bp.route('/calendar/delete/<int:entry_id>', methods=['POST'])
+@admin_required
+def delete_calendar_entry(entry_id):
+    entry = SchoolCalendar.query.get_or_404(entry_id)
+    db.session.delete(entry)
+    db.session.commit()
+    invalidate_calendar()
+    
+    flash('تم الحذف من التقويم بنجاح', 'success')
+    return redirect(url_for('admin.school_calendar'))
+
+# الجدول الزمني للحصص: حصص اليوم العادي وحصص الأيام المختلفة (مثل الخميس)
+@admin_bp.route('/periods', methods=['GET', 'POST'])
+@admin_required
+def periods():
+    form = PeriodForm()
+    
+    if form.validate_on_submit():
+        weekday = int(form.weekday.data) if form.weekday.data else None
+        period = Period.query.filter_by(number=form.number.data, weekday=weekday).first()
+        if not period:
+            period = Period(number=form.number.data, weekday=weekday)
+            db.session.add(period)
+        period.name = form.name.data or None
+        period.start_time = form.start_time.data
+        period.end_time = form.end_time.data
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # أضاف مسؤول آخر نفس الحصة في نفس اللحظة
+            db.session.rollback()
+            flash('هذه الحصة مسجلة بالفعل، يرجى المحاولة مرة أخرى', 'danger')
+            return redirect(url_for('admin.periods'))
+        invalidate_timetable()
+        
+        flash('تم حفظ الحصة بنجاح', 'success')
+        return redirect(url_for('admin.periods'))
+    
+    entries = Period.query.order_by(Period.weekday, Period.number).all()
+    
+    return render_template('admin/periods.html', 
+                          active_tab='periods',
+                          form=form,
+                          periods=entries,
+                          weekday_names=WEEKDAY_NAMES,
+                          current_year=datetime.now().year)
+
+@admin_bp.route('/periods/delete/<int:period_id>', methods=['POST'])
+@admin_required
+def delete_period(period_id):
+    period = Period.query.get_or_404(period_id)
+    db.session.delete(period)
+    db.session.commit()
+    invalidate_timetable()
+    
+    flash('تم حذف الحصة بنجاح', 'success')
+    return redirect(url_for('admin.periods'))
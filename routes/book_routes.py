@@ -1,53 +1,57 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import current_user
-from models import Book, Category, BorrowingRules
+from sqlalchemy.orm import joinedload
+from models import Book, Category
 from forms import BookReservationForm
 from datetime import datetime
 from __init__ import db
+from search import apply_book_search
+from pagination import keyset_paginate
+from rules_cache import get_borrowing_rules
+from cache import cached_page
 
 book_bp = Blueprint('book', __name__)
 
 @book_bp.route('/')
+@cached_page('catalog')
 def index():
-    latest_books = Book.query.order_by(Book.created_at.desc()).limit(6).all()
+    latest_books = Book.query.options(joinedload(Book.category)).order_by(Book.created_at.desc()).limit(6).all()
     categories = Category.query.limit(6).all()
-    borrowing_rules = BorrowingRules.query.first()
-    
-    if not borrowing_rules:
-        borrowing_rules = BorrowingRules(max_days=7, max_books=3, rules_text="شروط استعارة الكتب")
-        db.session.add(borrowing_rules)
-        db.session.commit()
+    borrowing_rules = get_borrowing_rules()
     
     return render_template('index.html', latest_books=latest_books, categories=categories, borrowing_rules=borrowing_rules, current_year=datetime.now().year)
 
 @book_bp.route('/books')
 def books():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     query = request.args.get('query', '')
     category_id = request.args.get('category', '')
-    sort = request.args.get('sort', 'title')
+    sort = request.args.get('sort') or ('relevance' if query else 'title')
     
-    # بناء الاستعلام
-    books_query = Book.query
+    # بناء الاستعلام (مع تحميل التصنيف في نفس الاستعلام لعرضه في كل بطاقة)
+    books_query = Book.query.options(joinedload(Book.category))
+    rank = None
     
-    # تطبيق البحث إذا وجد
+    # تطبيق البحث إذا وجد (فهرس البحث النصي الكامل)
     if query:
-        books_query = books_query.filter(Book.title.contains(query) | Book.author.contains(query))
+        books_query, rank = apply_book_search(db, books_query, Book, query)
     
     # تطبيق فلتر التصنيف إذا وجد
     if category_id and category_id.isdigit():
         books_query = books_query.filter_by(category_id=int(category_id))
     
-    # تطبيق الترتيب
-    if sort == 'title':
-        books_query = books_query.order_by(Book.title)
+    # تطبيق الترتيب (المعرف في النهاية لضمان ترتيب ثابت بين الصفحات)
+    if sort == 'relevance' and rank is not None:
+        order = [(rank, False), (Book.id, False)]
     elif sort == 'author':
-        books_query = books_query.order_by(Book.author)
+        order = [(Book.author, False), (Book.id, False)]
     elif sort == 'newest':
-        books_query = books_query.order_by(Book.created_at.desc())
+        order = [(Book.created_at, True), (Book.id, True)]
+    else:
+        order = [(Book.title, False), (Book.id, False)]
     
     # تنفيذ الاستعلام مع الصفحات
-    books = books_query.paginate(page=page, per_page=12)
+    books = keyset_paginate(books_query, order, cursor=cursor, per_page=12)
     categories = Category.query.all()
     
     return render_template('books.html', 
@@ -58,7 +62,7 @@ def books():
 
 @book_bp.route('/books/<int:book_id>')
 def book_details(book_id):
-    book = Book.query.get_or_404(book_id)
+    book = Book.query.options(joinedload(Book.category)).get_or_404(book_id)
     form = BookReservationForm()
     
     return render_template('book_details.html', 
@@ -67,11 +71,14 @@ def book_details(book_id):
                           current_year=datetime.now().year)
 
 @book_bp.route('/categories/<int:category_id>')
+@cached_page('catalog')
 def category_books(category_id):
     category = Category.query.get_or_404(category_id)
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
-    books = Book.query.filter_by(category_id=category_id).paginate(page=page, per_page=12)
+    books = keyset_paginate(Book.query.options(joinedload(Book.category)).filter_by(category_id=category_id),
+                            [(Book.title, False), (Book.id, False)],
+                            cursor=cursor, per_page=12)
     
     return render_template('category_books.html', 
                           category=category,
@@ -80,6 +87,7 @@ def category_books(category_id):
                           current_year=datetime.now().year)
 
 @book_bp.route('/categories')
+@cached_page('catalog')
 def categories():
     categories = Category.query.all()
     
@@ -89,12 +97,7 @@ def categories():
 
 @book_bp.route('/borrowing_rules')
 def borrowing_rules():
-    rules = BorrowingRules.query.first()
-    
-    if not rules:
-        rules = BorrowingRules(max_days=7, max_books=3, rules_text="شروط استعارة الكتب")
-        db.session.add(rules)
-        db.session.commit()
+    rules = get_borrowing_rules()
     
     return render_template('borrowing_rules.html', 
                           rules=rules,
@@ -0,0 +1,43 @@
+from flask import Blueprint, render_template, request, jsonify, abort
+from flask_login import login_required, current_user
+from functools import wraps
+from circulation import lookup, scan, CirculationError
+
+circulation_bp = Blueprint('circulation', __name__, url_prefix='/circulation')
+
+# مكتب الإعارة متاح للمسؤول وأمين المكتبة
+def librarian_required(f):
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated or current_user.role not in ['admin', 'librarian']:
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+@circulation_bp.route('/')
+@librarian_required
+def desk():
+    return render_template('circulation.html')
+
+@circulation_bp.route('/lookup')
+@librarian_required
+def lookup_code():
+    try:
+        return jsonify(lookup(request.args.get('code', '').strip()))
+    except CirculationError as e:
+        return jsonify({'error': str(e)}), e.status
+
+# مسح واحد = طلب واحد: {"code": "...", "username": "..."}
+@circulation_bp.route('/scan', methods=['POST'])
+@librarian_required
+def scan_code():
+    data = request.get_json(silent=True) or request.form
+    code = (data.get('code') or '').strip()
+    if not code:
+        return jsonify({'error': 'يرجى إدخال الرمز'}), 400
+    
+    try:
+        return jsonify(scan(code, (data.get('username') or '').strip() or None))
+    except CirculationError as e:
+        return jsonify({'error': str(e)}), e.status
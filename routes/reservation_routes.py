@@ -1,10 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, jsonify
 from flask_login import login_required, current_user
-from models import Book, BookReservation, Resource, ResourceReservation, BorrowingRules
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import Book, BookHold, BookReservation, Resource, ResourceReservation, ResourceReservationSeries
 from forms import BookReservationForm, ResourceReservationForm
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from __init__ import db
 from functools import wraps
+from reservation_engine import reserve_book_atomically, claim_hold, cancel_loan, renew_reservation, ReservationError
+from holds import place_hold, cancel_hold, hold_position, HoldError, ACTIVE_HOLD_STATUSES
+from outbox import unread_notifications, mark_notifications_read
+from availability import availability_grid, grid_to_json, week_range, month_range, parse_day, is_reserved
+from school_calendar import is_open_day, WEEKEND_DAYS
+from timetable import get_timetable, is_valid_period
+from resource_series import create_series, cancel_series, reserve_slot, is_missing_reference, SeriesConflict, SERIES_INTERVALS
 
 reservation_bp = Blueprint('reservation', __name__)
 
@@ -31,35 +40,19 @@ def reserve_book(book_id):
     form = BookReservationForm()
     
     if form.validate_on_submit():
-        # التحقق من عدد الكتب المستعارة للمستخدم
-        borrowing_rules = BorrowingRules.query.first()
-        active_reservations = BookReservation.query.filter_by(user_id=current_user.id, status='approved').count()
-        
-        if active_reservations >= borrowing_rules.max_books:
-            flash(f'لا يمكنك استعارة أكثر من {borrowing_rules.max_books} كتب في نفس الوقت', 'danger')
-            return redirect(url_for('book.book_details', book_id=book_id))
-        
-        # التحقق من أن التاريخ ليس في الماضي وليس يوم الجمعة أو السبت
+        # التحقق من أن التاريخ يوم دوام في التقويم المدرسي
         reservation_date = form.reservation_date.data
-        day_of_week = reservation_date.weekday()
         
-        if day_of_week == 4 or day_of_week == 5:  # 4 = الجمعة، 5 = السبت
-            flash('لا يمكن حجز الكتب في أيام الجمعة والسبت', 'danger')
+        if not is_open_day(reservation_date):
+            flash('لا يمكن حجز الكتب في أيام العطل', 'danger')
             return redirect(url_for('book.book_details', book_id=book_id))
         
-        # إنشاء الحجز
-        reservation = BookReservation(
-            user_id=current_user.id,
-            book_id=book_id,
-            reservation_date=reservation_date,
-            status='pending'
-        )
-        
-        # تحديث حالة الكتاب
-        book.available = False
-        
-        db.session.add(reservation)
-        db.session.commit()
+        # إنشاء الحجز وتحديث حالة الكتاب والتحقق من حد المستخدم في معاملة واحدة
+        try:
+            reserve_book_atomically(current_user, book, reservation_date)
+        except ReservationError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('book.book_details', book_id=book_id))
         
         flash('تم حجز الكتاب بنجاح. سيتم مراجعة طلبك من قبل المسؤول', 'success')
         return redirect(url_for('reservation.my_reservations'))
@@ -74,15 +67,26 @@ def reserve_book(book_id):
 @reservation_bp.route('/my_reservations')
 @login_required
 def my_reservations():
-    book_reservations = BookReservation.query.filter_by(user_id=current_user.id).order_by(BookReservation.created_at.desc()).all()
+    book_reservations = BookReservation.query.options(joinedload(BookReservation.book)) \
+        .filter_by(user_id=current_user.id).order_by(BookReservation.created_at.desc()).all()
     
     # للمعلمين فقط: عرض حجوزات المختبرات وغرف المصادر
     resource_reservations = []
     if current_user.role in ['teacher', 'admin']:
-        resource_reservations = ResourceReservation.query.filter_by(user_id=current_user.id).order_by(ResourceReservation.reservation_date.desc()).all()
+        resource_reservations = ResourceReservation.query.options(joinedload(ResourceReservation.resource)) \
+            .filter_by(user_id=current_user.id).order_by(ResourceReservation.reservation_date.desc()).all()
+    
+    # قائمة الانتظار مع ترتيب كل طلب في طابور الكتاب
+    holds = BookHold.query.options(joinedload(BookHold.book)) \
+        .filter(BookHold.user_id == current_user.id, BookHold.status.in_(ACTIVE_HOLD_STATUSES)) \
+        .order_by(BookHold.id).all()
+    hold_positions = {hold.id: hold_position(hold) for hold in holds}
     
     return render_template('my_reservations.html', 
                           book_reservations=book_reservations,
+                          holds=holds,
+                          hold_positions=hold_positions,
+                          notifications=unread_notifications(current_user.id),
                           resource_reservations=resource_reservations,
                           current_year=datetime.now().year)
 
@@ -95,15 +99,79 @@ def cancel_reservation(reservation_id):
     if reservation.user_id != current_user.id and current_user.role not in ['admin', 'librarian']:
         abort(403)
     
-    # إعادة الكتاب إلى حالة متاح
-    book = Book.query.get(reservation.book_id)
-    book.available = True
+    # حذف الحجز وإعادة نسخة الكتاب إلى الرف (الحجوزات قيد الانتظار فقط)
+    try:
+        cancel_loan(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash('تم إلغاء الحجز بنجاح', 'success')
+    return redirect(url_for('reservation.my_reservations'))
+
+@reservation_bp.route('/renew_reservation/<int:reservation_id>', methods=['POST'])
+@login_required
+def renew_book_reservation(reservation_id):
+    reservation = BookReservation.query.get_or_404(reservation_id)
     
-    # حذف الحجز
-    db.session.delete(reservation)
-    db.session.commit()
+    # التحقق من أن الحجز للمستخدم الحالي
+    if reservation.user_id != current_user.id and current_user.role not in ['admin', 'librarian']:
+        abort(403)
     
-    flash('تم إلغاء الحجز بنجاح', 'success')
+    try:
+        renew_reservation(reservation)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'تم تمديد الاستعارة حتى {reservation.due_date.strftime("%Y-%m-%d")}', 'success')
+    return redirect(url_for('reservation.my_reservations'))
+
+@reservation_bp.route('/hold_book/<int:book_id>', methods=['POST'])
+@login_required
+def hold_book(book_id):
+    book = Book.query.get_or_404(book_id)
+    
+    try:
+        hold = place_hold(current_user, book)
+    except HoldError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('book.book_details', book_id=book_id))
+    
+    flash(f'تمت إضافتك إلى قائمة الانتظار. ترتيبك: {hold_position(hold)}', 'success')
+    return redirect(url_for('reservation.my_reservations'))
+
+@reservation_bp.route('/holds/<int:hold_id>/claim', methods=['POST'])
+@login_required
+def claim_book_hold(hold_id):
+    hold = BookHold.query.get_or_404(hold_id)
+    
+    try:
+        claim_hold(current_user, hold)
+    except ReservationError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reservation.my_reservations'))
+    
+    flash('تم حجز الكتاب بنجاح. سيتم مراجعة طلبك من قبل المسؤول', 'success')
+    return redirect(url_for('reservation.my_reservations'))
+
+@reservation_bp.route('/holds/<int:hold_id>/cancel', methods=['POST'])
+@login_required
+def cancel_book_hold(hold_id):
+    hold = BookHold.query.get_or_404(hold_id)
+    
+    # التحقق من أن الطلب للمستخدم الحالي
+    if hold.user_id != current_user.id and current_user.role not in ['admin', 'librarian']:
+        abort(403)
+    
+    if hold.status in ACTIVE_HOLD_STATUSES:
+        cancel_hold(hold)
+    
+    flash('تم إلغاء طلب الانتظار', 'success')
+    return redirect(url_for('reservation.my_reservations'))
+
+@reservation_bp.route('/notifications/read', methods=['POST'])
+@login_required
+def read_notifications():
+    mark_notifications_read(current_user.id)
     return redirect(url_for('reservation.my_reservations'))
 
 @reservation_bp.route('/resources')
@@ -131,68 +199,174 @@ def resources():
         reservations[reservation.resource_id].append(reservation.period)
     
     # الحصول على حجوزات المستخدم الحالي
-    my_reservations = ResourceReservation.query.filter_by(user_id=current_user.id).order_by(ResourceReservation.reservation_date).all()
+    my_reservations = ResourceReservation.query.options(joinedload(ResourceReservation.resource)) \
+        .filter_by(user_id=current_user.id).order_by(ResourceReservation.reservation_date).all()
+    
+    # سلاسل الحجز المتكرر الحالية للمستخدم
+    my_series = ResourceReservationSeries.query.options(joinedload(ResourceReservationSeries.resource)) \
+        .filter(ResourceReservationSeries.user_id == current_user.id,
+                ResourceReservationSeries.end_date >= date.today()) \
+        .order_by(ResourceReservationSeries.start_date).all()
+    
+    # حصص اليوم المختار من الجدول الزمني المخزن، وكل الحصص لنموذج الحجز المتكرر
+    timetable = get_timetable()
     
     return render_template('resources.html', 
                           resources=resources,
+                          periods=timetable.periods_for(selected_date_obj),
+                          all_periods=timetable.columns,
                           reservations=reservations,
                           my_reservations=my_reservations,
+                          my_series=my_series,
+                          series_intervals=SERIES_INTERVALS,
                           today=today,
                           current_year=datetime.now().year)
 
+# جدول الإشغال لأسبوع أو شهر كامل في طلب واحد
+@reservation_bp.route('/resources/grid')
+@login_required
+@teacher_required
+def resources_grid():
+    view = request.args.get('view', 'week')
+    selected = parse_day(request.args.get('date'))
+    start, end = month_range(selected) if view == 'month' else week_range(selected)
+    grid = availability_grid(start, end, user_id=current_user.id)
+    
+    return render_template('resources_grid.html', 
+                          grid=grid,
+                          view=view,
+                          selected=selected,
+                          previous=start - timedelta(days=1),
+                          following=end + timedelta(days=1),
+                          is_reserved=is_reserved,
+                          today=date.today(),
+                          current_year=datetime.now().year)
+
+@reservation_bp.route('/resources/availability.json')
+@login_required
+@teacher_required
+def resources_availability():
+    start = parse_day(request.args.get('start'))
+    end = parse_day(request.args.get('end'), start + timedelta(days=6))
+    resource_ids = [int(i) for i in request.args.getlist('resource_id') if i.isdigit()]
+    return jsonify(grid_to_json(availability_grid(start, end, resource_ids, user_id=current_user.id)))
+
 @reservation_bp.route('/reserve_resource', methods=['POST'])
 @login_required
 @teacher_required
 def reserve_resource():
-    resource_id = request.form.get('resource_id')
+    resource_id = request.form.get('resource_id', type=int)
     date_str = request.form.get('date')
-    period = request.form.get('period')
+    period = request.form.get('period', type=int)
     
     if not resource_id or not date_str or not period:
-        flash('بيانات غير كاملة', 'danger')
-        return redirect(url_for('reservation.resources'))
+        return _resource_response('بيانات غير كاملة', 'danger', 400)
     
     # تحويل التاريخ إلى كائن date
     try:
         reservation_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     except ValueError:
-        flash('تاريخ غير صالح', 'danger')
-        return redirect(url_for('reservation.resources'))
+        return _resource_response('تاريخ غير صالح', 'danger', 400)
     
     # التحقق من أن التاريخ ليس في الماضي
     if reservation_date < date.today():
-        flash('لا يمكن الحجز في تاريخ سابق', 'danger')
+        return _resource_response('لا يمكن الحجز في تاريخ سابق', 'danger', 400)
+    
+    # التحقق من أن التاريخ يوم دوام في التقويم المدرسي (ليس الجمعة أو السبت أو عطلة)
+    if not is_open_day(reservation_date):
+        return _resource_response('لا يمكن حجز المختبرات في أيام العطل', 'danger', 400)
+    
+    # التحقق من وجود الحصة في جدول هذا اليوم
+    if not is_valid_period(reservation_date, period):
+        return _resource_response('هذه الحصة غير موجودة في جدول هذا اليوم', 'danger', 400)
+    
+    # إنشاء الحجز مباشرة؛ القيد الفريد يمنع تكرار الحجز لنفس المورد في نفس التاريخ والحصة،
+    # وقيد المفتاح الأجنبي يرفض المورد غير الموجود دون استعلام فحص قبل الإدراج
+    try:
+        reservation = reserve_slot(current_user, resource_id, reservation_date, period)
+    except IntegrityError as e:
+        if not is_missing_reference(e):
+            raise
+        return _resource_response('المورد غير موجود', 'danger', 404)
+    if reservation is None:
+        return _resource_response('هذا المورد محجوز بالفعل في هذا التاريخ والحصة', 'danger', 409)
+    
+    return _resource_response('تم حجز المورد بنجاح', 'success', 201, reservation_id=reservation.id)
+
+# نتيجة الحجز: JSON مع رمز الحالة لطلبات fetch، ورسالة وتحويل لنموذج الصفحة
+def _resource_response(message, category, status, **data):
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(message=message, **data), status
+    flash(message, category)
+    return redirect(url_for('reservation.resources'))
+
+# حجز متكرر: نفس المورد والحصة كل أسبوع أو أسبوعين حتى تاريخ محدد
+@reservation_bp.route('/reserve_resource/series', methods=['POST'])
+@login_required
+@teacher_required
+def reserve_resource_series():
+    resource_id = request.form.get('resource_id', type=int)
+    period = request.form.get('period', type=int)
+    interval_weeks = request.form.get('interval', 1, type=int)
+    skip_conflicts = request.form.get('skip_conflicts') == '1'
+    
+    try:
+        start = datetime.strptime(request.form.get('date', ''), '%Y-%m-%d').date()
+        until = datetime.strptime(request.form.get('until', ''), '%Y-%m-%d').date()
+    except ValueError:
+        flash('تاريخ غير صالح', 'danger')
         return redirect(url_for('reservation.resources'))
     
-    # التحقق من أن التاريخ ليس يوم الجمعة أو السبت
-    day_of_week = reservation_date.weekday()
-    if day_of_week == 4 or day_of_week == 5:  # 4 = الجمعة، 5 = السبت
-        flash('لا يمكن حجز المختبرات في أيام الجمعة والسبت', 'danger')
+    if not resource_id or not period or interval_weeks not in SERIES_INTERVALS or not Resource.query.get(resource_id):
+        flash('بيانات غير كاملة', 'danger')
         return redirect(url_for('reservation.resources'))
     
-    # التحقق من عدم وجود حجز سابق لنفس المورد في نفس التاريخ والحصة
-    existing_reservation = ResourceReservation.query.filter_by(
-        resource_id=resource_id,
-        reservation_date=reservation_date,
-        period=period
-    ).first()
+    if start < date.today() or until < start:
+        flash('لا يمكن الحجز في تاريخ سابق', 'danger')
+        return redirect(url_for('reservation.resources'))
     
-    if existing_reservation:
-        flash('هذا المورد محجوز بالفعل في هذا التاريخ والحصة', 'danger')
+    # كل تواريخ السلسلة في نفس يوم الأسبوع، فلا تبدأ في العطلة الأسبوعية؛ أما إذا وقع يوم البداية
+    # في عطلة رسمية أو امتحانات فيتخطى مثل باقي الأيام المغلقة في السلسلة
+    if start.weekday() in WEEKEND_DAYS:
+        flash('لا يمكن حجز المختبرات في أيام العطلة الأسبوعية', 'danger')
         return redirect(url_for('reservation.resources'))
     
-    # إنشاء الحجز
-    reservation = ResourceReservation(
-        user_id=current_user.id,
-        resource_id=resource_id,
-        reservation_date=reservation_date,
-        period=int(period)
-    )
+    # ويكفي التحقق من جدول حصص يوم البداية
+    if not is_valid_period(start, period):
+        flash('هذه الحصة غير موجودة في جدول هذا اليوم', 'danger')
+        return redirect(url_for('reservation.resources'))
     
-    db.session.add(reservation)
-    db.session.commit()
+    try:
+        series, skipped = create_series(current_user, resource_id, period, start, until,
+                                        interval_weeks, skip_conflicts)
+    except SeriesConflict as e:
+        if e.dates:
+            flash('المورد محجوز في التواريخ التالية: {}'.format(
+                '، '.join(day.strftime('%Y-%m-%d') for day in e.dates)), 'danger')
+        else:
+            flash('لا توجد أيام دراسية في الفترة المحددة', 'danger')
+        return redirect(url_for('reservation.resources', date=start.strftime('%Y-%m-%d')))
+    
+    flash('تم حجز المورد من {} إلى {}'.format(series.start_date.strftime('%Y-%m-%d'),
+                                              series.end_date.strftime('%Y-%m-%d')), 'success')
+    if skipped:
+        flash('تم تخطي التواريخ المحجوزة: {}'.format(
+            '، '.join(day.strftime('%Y-%m-%d') for day in skipped)), 'warning')
+    return redirect(url_for('reservation.resources', date=start.strftime('%Y-%m-%d')))
+
+@reservation_bp.route('/cancel_resource_series/<int:series_id>', methods=['POST'])
+@login_required
+@teacher_required
+def cancel_resource_series(series_id):
+    series = ResourceReservationSeries.query.get_or_404(series_id)
+    
+    if series.user_id != current_user.id and current_user.role != 'admin':
+        abort(403)
+    
+    # تلغى الحجوزات القادمة فقط، وتبقى الحصص السابقة في السجل
+    cancel_series(series)
     
-    flash('تم حجز المورد بنجاح', 'success')
+    flash('تم إلغاء الحجز المتكرر بنجاح', 'success')
     return redirect(url_for('reservation.resources'))
 
 @reservation_bp.route('/cancel_resource_reservation/<int:reservation_id>', methods=['POST'])
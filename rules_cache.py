@@ -0,0 +1,37 @@
+from __init__ import db
+from models import BorrowingRules
+from snapshot_cache import SnapshotCache
+
+# نسخة مخزنة مؤقتاً من شروط الاستعارة على مستوى العملية
+# تحمل من قاعدة البيانات مرة واحدة، ويتحقق من رقم الإصدار في الجدول كل RULES_CACHE_TTL ثانية
+# حتى تلتقط العمليات الأخرى أي تعديل يجريه المسؤول
+class RulesSnapshot:
+    def __init__(self, max_days, max_books, rules_text, updated_at=None, version=0):
+        self.max_days = max_days
+        self.max_books = max_books
+        self.rules_text = rules_text
+        self.updated_at = updated_at
+        self.version = version
+
+# القيم الافتراضية عند عدم وجود صف في الجدول (بدون إنشاء صف أثناء القراءة)
+DEFAULT_RULES = RulesSnapshot(max_days=7, max_books=3, rules_text="شروط استعارة الكتب")
+
+def _current_version():
+    return db.session.query(BorrowingRules.version).order_by(BorrowingRules.id).limit(1).scalar()
+
+def _load():
+    rules = BorrowingRules.query.order_by(BorrowingRules.id).first()
+    if not rules:
+        return DEFAULT_RULES
+    return RulesSnapshot(rules.max_days, rules.max_books, rules.rules_text, rules.updated_at, rules.version)
+
+_rules = SnapshotCache(_load, 'RULES_CACHE_TTL', 5, signature=_current_version)
+
+def get_borrowing_rules():
+    return _rules.get()
+
+# يستدعى قبل حفظ تعديل الشروط: يرفع رقم الإصدار في نفس المعاملة ويفرغ النسخة المحلية
+def invalidate_borrowing_rules(rules=None):
+    if rules is not None:
+        rules.version = (rules.version or 0) + 1
+    _rules.invalidate()
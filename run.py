@@ -1,6 +1,11 @@
+import os
 from __init__ import create_app
+from jobs import start_worker
 
 app = create_app()
 
 if __name__ == '__main__':
+    # عامل المهام الخلفية في عملية الخادم الفعلية فقط (وليس في عملية مراقبة إعادة التحميل)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker(app)
     app.run(debug=True, host='0.0.0.0')
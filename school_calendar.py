@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from __init__ import db
+from models import SchoolCalendar
+from snapshot_cache import SnapshotCache
+
+# أيام الدوام المدرسي محسوبة مسبقاً من جدول التقويم ومخزنة على مستوى العملية،
+# فالتحقق من أي تاريخ (حجز كتاب أو مختبر، موعد إعادة، جدول الإشغال، الحجز المتكرر)
+# بحث في مجموعة بدلاً من استعلام لكل يوم. يتحقق من توقيع الجدول (عدد الصفوف وآخر تعديل)
+# كل CALENDAR_CACHE_TTL ثانية حتى تلتقط العمليات الأخرى تعديلات المسؤول
+
+CALENDAR_KINDS = {
+    'term': 'فصل دراسي',
+    'holiday': 'عطلة',
+    'exam': 'اختبارات',
+}
+
+# الفترات التي يغلق فيها الحجز داخل الفصل الدراسي
+CLOSED_KINDS = ('holiday', 'exam')
+
+# أيام العطلة الأسبوعية (4 = الجمعة، 5 = السبت)
+WEEKEND_DAYS = (4, 5)
+
+# أقصى عدد أيام يبحث فيها عن يوم الدوام التالي (مثلاً بعد العطلة الصيفية)
+MAX_LOOKAHEAD_DAYS = 120
+
+class CalendarSnapshot:
+    def __init__(self, open_days, closed_days):
+        # None إذا لم تعرف أي فصول دراسية: كل يوم غير العطلة الأسبوعية والعطل المسجلة يوم دوام
+        self.open_days = open_days
+        self.closed_days = closed_days
+
+    def is_open(self, day):
+        if self.open_days is not None:
+            return day in self.open_days
+        return day.weekday() not in WEEKEND_DAYS and day not in self.closed_days
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+def _signature():
+    return tuple(db.session.execute(
+        select(func.count(SchoolCalendar.id), func.max(SchoolCalendar.updated_at))
+    ).one())
+
+def _load():
+    entries = SchoolCalendar.query.all()
+    closed = frozenset(day for entry in entries if entry.kind in CLOSED_KINDS
+                       for day in _days(entry.start_date, entry.end_date))
+    terms = [entry for entry in entries if entry.kind == 'term']
+    if not terms:
+        return CalendarSnapshot(None, closed)
+
+    open_days = frozenset(day for entry in terms for day in _days(entry.start_date, entry.end_date)
+                          if day.weekday() not in WEEKEND_DAYS and day not in closed)
+    return CalendarSnapshot(open_days, closed)
+
+_calendar = SnapshotCache(_load, 'CALENDAR_CACHE_TTL', 60, signature=_signature)
+
+def get_calendar():
+    return _calendar.get()
+
+# يستدعى بعد حفظ أي تعديل على التقويم
+def invalidate_calendar():
+    _calendar.invalidate()
+
+def _as_date(day):
+    return day.date() if isinstance(day, datetime) else day
+
+def is_open_day(day):
+    return get_calendar().is_open(_as_date(day))
+
+# أيام الدوام بين تاريخين (شاملين)
+def open_days(start, end):
+    calendar = get_calendar()
+    return [day for day in _days(start, end) if calendar.is_open(day)]
+
+# أول يوم دوام بدءاً من اليوم المعطى (يحافظ على الوقت إن كان datetime)
+def next_open_day(day):
+    calendar = get_calendar()
+    for offset in range(MAX_LOOKAHEAD_DAYS):
+        candidate = day + timedelta(days=offset)
+        if calendar.is_open(_as_date(candidate)):
+            return candidate
+    # لا يوجد فصل دراسي مسجل بعد هذا التاريخ: يكفي تجاوز العطلة الأسبوعية
+    while day.weekday() in WEEKEND_DAYS:
+        day += timedelta(days=1)
+    return day
@@ -0,0 +1,156 @@
+import re
+from sqlalchemy import text, table, column, literal_column, select, event
+
+# توحيد أشكال الحروف العربية التي لا يفرق بينها المستخدم عند البحث
+ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و',
+    'ئ': 'ي',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+
+# التشكيل (الفتحة حتى السكون) والألف الخنجرية والتطويل
+ARABIC_DIACRITICS = re.compile('[\u064B-\u0652\u0670\u0640]')
+
+# تطبيع النص للبحث: يستخدم عند الكتابة (مفاتيح البحث المخزنة) وعند قراءة نص البحث
+def normalize_text(value):
+    if not value:
+        return ''
+    value = ARABIC_DIACRITICS.sub('', value)
+    value = value.translate(ARABIC_FOLDING).lower()
+    return ' '.join(value.split())
+
+# الأعمدة المطبعة في جدول الكتب والأعمدة الأصلية التي تحسب منها
+SEARCH_KEYS = {
+    'title_search': 'title',
+    'author_search': 'author',
+}
+
+def _fill_search_keys(mapper, connection, target):
+    for key, source in SEARCH_KEYS.items():
+        setattr(target, key, normalize_text(getattr(target, source)))
+
+# ربط نموذج الكتاب بحساب مفاتيح البحث مرة واحدة عند الحفظ
+def register_search_keys(book_model):
+    event.listen(book_model, 'before_insert', _fill_search_keys)
+    event.listen(book_model, 'before_update', _fill_search_keys)
+
+# جدول البحث النصي الكامل (FTS5) المرتبط بجدول الكتب
+# الجدول من نوع external content فلا تتكرر بيانات الكتب، والمزامنة تتم عبر triggers
+# داخل قاعدة البيانات نفسها فتشمل أي إضافة أو تعديل أو حذف مهما كان مصدره
+BOOK_FTS_COLUMNS = ['title_search', 'author_search', 'isbn', 'description']
+
+BOOK_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title_search, author_search, isbn, description,
+        content='book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title_search, author_search, isbn, description)
+        VALUES (new.id, new.title_search, new.author_search, new.isbn, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title_search, author_search, isbn, description)
+        VALUES ('delete', old.id, old.title_search, old.author_search, old.isbn, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title_search, author_search, isbn, description ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title_search, author_search, isbn, description)
+        VALUES ('delete', old.id, old.title_search, old.author_search, old.isbn, old.description);
+        INSERT INTO book_fts(rowid, title_search, author_search, isbn, description)
+        VALUES (new.id, new.title_search, new.author_search, new.isbn, new.description);
+    END
+    """,
+]
+
+BOOK_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS book_fts_ai",
+    "DROP TRIGGER IF EXISTS book_fts_ad",
+    "DROP TRIGGER IF EXISTS book_fts_au",
+    "DROP TABLE IF EXISTS book_fts",
+]
+
+book_fts = table('book_fts', column('rowid'), column('rank'))
+
+def fts_enabled(db):
+    return db.engine.dialect.name == 'sqlite'
+
+def _table_columns(connection, name):
+    return [row[1] for row in connection.execute(text("PRAGMA table_info({})".format(name)))]
+
+# إضافة أعمدة البحث المطبعة لقواعد البيانات القديمة وتعبئتها مرة واحدة
+def _ensure_search_keys(connection):
+    book_columns = _table_columns(connection, 'book')
+    missing = [key for key in SEARCH_KEYS if key not in book_columns]
+    if not missing:
+        return False
+
+    for key in missing:
+        connection.execute(text("ALTER TABLE book ADD COLUMN {} VARCHAR(200)".format(key)))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_book_{0} ON book ({0})".format(key)))
+
+    rows = connection.execute(text("SELECT id, title, author FROM book")).fetchall()
+    if rows:
+        connection.execute(
+            text("UPDATE book SET title_search = :title_search, author_search = :author_search WHERE id = :id"),
+            [{'id': row.id, 'title_search': normalize_text(row.title), 'author_search': normalize_text(row.author)}
+             for row in rows]
+        )
+    return True
+
+# إنشاء جدول البحث والـ triggers وبناء الفهرس للكتب الموجودة مسبقاً
+def init_book_search(db):
+    if not fts_enabled(db):
+        return False
+
+    with db.engine.begin() as connection:
+        _ensure_search_keys(connection)
+
+        fts_columns = _table_columns(connection, 'book_fts')
+        rebuild = fts_columns != BOOK_FTS_COLUMNS
+        if rebuild and fts_columns:
+            # مخطط فهرس قديم: يعاد إنشاؤه على الأعمدة المطبعة
+            for statement in BOOK_FTS_DROP:
+                connection.execute(text(statement))
+
+        for statement in BOOK_FTS_DDL:
+            connection.execute(text(statement))
+
+        if rebuild:
+            connection.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+
+    return True
+
+# تحويل نص البحث إلى تعبير MATCH آمن (كل كلمة بين علامتي تنصيص مع بحث بالبادئة)
+def build_match_expression(query):
+    terms = re.findall(r'\w+', normalize_text(query))
+    return ' '.join('"{}"*'.format(term) for term in terms)
+
+# تطبيق البحث على استعلام الكتب، وإرجاع الاستعلام مع عمود الترتيب حسب الصلة
+def apply_book_search(db, books_query, book_model, query):
+    match = build_match_expression(query)
+    if not match:
+        return books_query, None
+
+    if not fts_enabled(db):
+        normalized = normalize_text(query)
+        books_query = books_query.filter(book_model.title_search.contains(normalized) |
+                                         book_model.author_search.contains(normalized))
+        return books_query, None
+
+    ranked = select(book_fts.c.rowid.label('book_id'), book_fts.c.rank.label('rank')) \
+        .where(literal_column('book_fts').match(match)) \
+        .subquery('book_search')
+
+    books_query = books_query.join(ranked, book_model.id == ranked.c.book_id)
+    return books_query, ranked.c.rank
@@ -0,0 +1,39 @@
+import threading
+import time
+from flask import current_app
+
+# نسخة مخزنة على مستوى العملية لبيانات صغيرة تقرأ مع كل طلب (شروط الاستعارة، التقويم المدرسي،
+# الجدول الزمني، إحصائيات لوحة التحكم). بعد مرور مدة الصلاحية (ttl_key في إعدادات التطبيق)
+# يحسب التوقيع باستعلام صغير ولا يعاد التحميل إلا إذا تغير، حتى تلتقط العمليات الأخرى تعديلات
+# المسؤول؛ بدون دالة توقيع يعاد التحميل كلما انتهت المدة
+class SnapshotCache:
+    def __init__(self, load, ttl_key, default_ttl, signature=None):
+        self.load = load
+        self.signature = signature
+        self.ttl_key = ttl_key
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._signed = None
+        self._checked_at = 0.0
+
+    def get(self):
+        ttl = current_app.config.get(self.ttl_key, self.default_ttl)
+        now = time.monotonic()
+
+        with self._lock:
+            if self._value is not None and now - self._checked_at < ttl:
+                return self._value
+
+            signature = self.signature() if self.signature else None
+            if self._value is None or self.signature is None or signature != self._signed:
+                self._value = self.load()
+                self._signed = signature
+            self._checked_at = now
+            return self._value
+
+    # يستدعى بعد حفظ أي تعديل في نفس العملية
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._checked_at = 0.0
@@ -0,0 +1,32 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from __init__ import create_app, db
+
+
+# تطبيق بقاعدة بيانات SQLite في ملف مؤقت (وليس في الذاكرة) حتى تتشارك الخيوط نفس القاعدة
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(tmp_path / 'test.db'),
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'QUERY_PLAN_CHECK': False,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
@@ -0,0 +1,41 @@
+from datetime import datetime
+import pytest
+from flask import render_template_string
+from sqlalchemy.orm import joinedload
+from __init__ import create_app, db
+from models import Book, BookReservation
+from query_counter import LazyLoadError
+
+LIST_PAGE = '<ul>{% for r in reservations %}<li>{{ r.user.name }} - {{ r.book.title }}</li>{% endfor %}</ul>'
+
+
+def _add_reservation():
+    book = Book(title='كتاب', category_id=1, added_by=1)
+    db.session.add(book)
+    db.session.flush()
+    db.session.add(BookReservation(user_id=1, book_id=book.id, reservation_date=datetime.now()))
+    db.session.commit()
+
+
+def test_lazy_load_while_rendering_a_list_raises(app):
+    with app.app_context():
+        _add_reservation()
+
+    with app.test_request_context():
+        reservations = BookReservation.query.all()
+        with pytest.raises(LazyLoadError):
+            render_template_string(LIST_PAGE, reservations=reservations)
+
+    with app.test_request_context():
+        reservations = BookReservation.query.options(joinedload(BookReservation.user),
+                                                     joinedload(BookReservation.book)).all()
+        assert 'كتاب' in render_template_string(LIST_PAGE, reservations=reservations)
+
+
+# إنشاء تطبيق آخر لا يضيف مستمعاً ثانياً على جلسات db.session
+def test_lazy_load_listener_is_registered_once(app, tmp_path):
+    other = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(tmp_path / 'other.db'), 'TESTING': True})
+    with other.app_context():
+        db.engine.dispose()
+    with app.app_context():
+        assert len(db.session().dispatch.do_orm_execute) == 1
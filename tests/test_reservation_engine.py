@@ -0,0 +1,98 @@
+import threading
+from datetime import date
+from sqlalchemy import select, func
+from __init__ import db
+from models import User, Book, BookCopy, BookReservation
+from inventory import add_copies
+from reservation_engine import reserve_book_atomically, ReservationError, ACTIVE_STATUSES
+from rules_cache import get_borrowing_rules
+
+THREADS = 12
+
+
+def _make_book(copies):
+    book = Book(title='كتاب', category_id=1, added_by=1)
+    db.session.add(book)
+    db.session.flush()
+    add_copies(book, copies)
+    db.session.commit()
+    return book.id
+
+
+def _make_users(count):
+    users = [User(username='user{}'.format(i), password='x', name='مستخدم') for i in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+
+# تشغيل الطلبات في خيوط متوازية تبدأ معاً؛ كل خيط بسياق تطبيق وجلسة مستقلين
+def _run_parallel(app, calls):
+    barrier = threading.Barrier(len(calls))
+    results = []
+    lock = threading.Lock()
+
+    def worker(user_id, book_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            book = db.session.get(Book, book_id)
+            barrier.wait()
+            try:
+                reserve_book_atomically(user, book, date.today())
+                outcome = 'ok'
+            except ReservationError:
+                outcome = 'refused'
+            finally:
+                db.session.remove()
+            with lock:
+                results.append(outcome)
+
+    threads = [threading.Thread(target=worker, args=call) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _active_per_copy():
+    return db.session.execute(
+        select(BookReservation.copy_id, func.count(BookReservation.id))
+        .where(BookReservation.status.in_(ACTIVE_STATUSES))
+        .group_by(BookReservation.copy_id)
+    ).all()
+
+
+def test_parallel_reservations_never_overbook(app):
+    with app.app_context():
+        book_id = _make_book(3)
+        user_ids = _make_users(THREADS)
+
+    results = _run_parallel(app, [(user_id, book_id) for user_id in user_ids])
+
+    with app.app_context():
+        book = db.session.get(Book, book_id)
+        assert results.count('ok') == 3
+        assert book.available_copies == 0
+        assert not book.available
+        assert BookCopy.query.filter_by(book_id=book_id, status='available').count() == 0
+        assert all(count == 1 for _, count in _active_per_copy())
+        assert BookReservation.query.count() == 3
+
+
+def test_parallel_reservations_respect_borrowing_limit(app):
+    with app.app_context():
+        max_books = get_borrowing_rules().max_books
+        book_ids = [_make_book(1) for _ in range(THREADS)]
+        user_id = _make_users(1)[0]
+
+    results = _run_parallel(app, [(user_id, book_id) for book_id in book_ids])
+
+    with app.app_context():
+        active = BookReservation.query.filter(BookReservation.user_id == user_id,
+                                              BookReservation.status.in_(ACTIVE_STATUSES)).count()
+        assert results.count('ok') == active == max_books
+        # الحجوزات المرفوضة لا تترك نسخاً محجوزة
+        assert db.session.execute(select(func.sum(Book.available_copies))).scalar() == THREADS - max_books
+        assert all(count == 1 for _, count in _active_per_copy())
+        assert min(book.available_copies for book in Book.query.all()) >= 0
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, func
+from __init__ import db
+from models import User, Book, BookCopy, BookHold, BookReservation, ReservationStat
+from inventory import add_copies
+from holds import place_hold, cancel_hold, expire_holds
+from reservation_engine import (reserve_book_atomically, approve_loan, return_loan, cancel_loan,
+                                ReservationError)
+
+
+def _setup():
+    book = Book(title='كتاب', category_id=1, added_by=1)
+    db.session.add(book)
+    db.session.flush()
+    add_copies(book, 1)
+    users = [User(username='user{}'.format(i), password='x', name='مستخدم') for i in range(3)]
+    db.session.add_all(users)
+    db.session.commit()
+    return book, users
+
+
+# تكرار الإجراء على نفس الحجز لا يعيد النسخة مرتين ولا يعتمد حجزاً معاداً
+def test_repeated_transitions_are_refused(app):
+    with app.app_context():
+        book, (reader, waiting, _) = _setup()
+        reservation = reserve_book_atomically(reader, book, datetime.now())
+        hold = place_hold(waiting, book)
+
+        approve_loan(reservation)
+        return_loan(reservation)
+        with pytest.raises(ReservationError):
+            return_loan(reservation)
+        with pytest.raises(ReservationError):
+            approve_loan(reservation)
+
+        assert db.session.get(BookReservation, reservation.id).status == 'returned'
+        hold = db.session.get(BookHold, hold.id)
+        assert hold.status == 'ready'
+        assert db.session.get(BookCopy, hold.copy_id).status == 'reserved'
+        assert db.session.get(Book, book.id).available_copies == 0
+
+
+def test_only_pending_reservations_can_be_cancelled(app):
+    with app.app_context():
+        book, (reader, _, _) = _setup()
+        reservation = reserve_book_atomically(reader, book, datetime.now())
+        approve_loan(reservation)
+
+        with pytest.raises(ReservationError):
+            cancel_loan(reservation)
+        assert db.session.get(BookReservation, reservation.id).status == 'approved'
+        assert db.session.get(Book, book.id).available_copies == 0
+
+        return_loan(reservation)
+        second = reserve_book_atomically(reader, book, datetime.now())
+        cancel_loan(second)
+        assert db.session.get(BookReservation, second.id) is None
+        assert db.session.get(Book, book.id).available_copies == 1
+
+
+# الإحصائيات تحسب التغيير الفعلي فقط، لا كل نقرة على الإجراء
+def test_refused_transitions_are_not_counted(app):
+    with app.app_context():
+        book, (reader, _, _) = _setup()
+        reservation = reserve_book_atomically(reader, book, datetime.now())
+        for action in (approve_loan, return_loan, return_loan, approve_loan, cancel_loan):
+            try:
+                action(reservation)
+            except ReservationError:
+                pass
+
+        totals = db.session.execute(
+            select(*[func.sum(getattr(ReservationStat, name))
+                     for name in ('requested', 'approved', 'returned', 'cancelled')])
+        ).one()
+        assert tuple(totals) == (1, 1, 1, 0)
+        assert db.session.get(BookReservation, reservation.id) is not None
+
+
+# النسخة تمرر مرة واحدة فقط مهما تكرر الإلغاء أو الإنهاء على نفس الدور
+def test_finished_holds_pass_the_copy_once(app):
+    with app.app_context():
+        book, (reader, first, second) = _setup()
+        reservation = reserve_book_atomically(reader, book, datetime.now())
+        first_hold = place_hold(first, book)
+        second_hold = place_hold(second, book)
+        approve_loan(reservation)
+        return_loan(reservation)
+
+        first_ready_until = db.session.get(BookHold, first_hold.id).ready_until
+        assert expire_holds(first_ready_until + timedelta(seconds=1)) == 1
+        cancel_hold(first_hold)
+        assert db.session.get(BookHold, first_hold.id).status == 'expired'
+        assert db.session.get(BookHold, second_hold.id).status == 'ready'
+
+        cancel_hold(second_hold)
+        cancel_hold(second_hold)
+        assert db.session.get(Book, book.id).available_copies == 1
@@ -0,0 +1,54 @@
+import threading
+from datetime import date, timedelta
+from __init__ import db
+from models import ResourceReservation
+from school_calendar import is_open_day
+from conftest import login
+
+JSON = {'Accept': 'application/json'}
+
+
+def _next_open_day(app):
+    with app.app_context():
+        day = date.today() + timedelta(days=1)
+        while not is_open_day(day):
+            day += timedelta(days=1)
+        return day.strftime('%Y-%m-%d')
+
+
+def test_parallel_bookings_of_same_slot(app):
+    day = _next_open_day(app)
+    clients = [app.test_client() for _ in range(2)]
+    for client in clients:
+        login(client, 1)
+
+    barrier = threading.Barrier(len(clients))
+    statuses = []
+    lock = threading.Lock()
+
+    def worker(client):
+        barrier.wait()
+        response = client.post('/reserve_resource', headers=JSON,
+                               data={'resource_id': 1, 'date': day, 'period': 3})
+        with lock:
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201, 409]
+    with app.app_context():
+        assert ResourceReservation.query.filter_by(resource_id=1, period=3).count() == 1
+
+
+def test_unknown_resource_is_not_a_conflict(app, client):
+    login(client, 1)
+    response = client.post('/reserve_resource', headers=JSON,
+                           data={'resource_id': 999, 'date': _next_open_day(app), 'period': 1})
+
+    assert response.status_code == 404
+    with app.app_context():
+        assert db.session.query(ResourceReservation).count() == 0
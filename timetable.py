@@ -0,0 +1,113 @@
+from sqlalchemy import select, func
+from __init__ import db
+from models import Period
+from snapshot_cache import SnapshotCache
+
+# الجدول الزمني للحصص محمل مرة واحدة ومخزن على مستوى العملية: لكل يوم من أيام الأسبوع
+# قائمة حصصه وقناع (bitmap) بأرقامها، فالتحقق من الحصة وبناء جدول الإشغال والتصدير
+# بحث في الذاكرة. يتحقق من توقيع الجدول كل TIMETABLE_CACHE_TTL ثانية كما في التقويم المدرسي
+
+# جدول اليوم العادي عند عدم تسجيل حصصه: ثماني حصص بدون أوقات
+DEFAULT_PERIOD_COUNT = 8
+
+# أكبر رقم حصة (أرقام الحصص بتات في قناع الإشغال)
+MAX_PERIOD_NUMBER = 16
+
+WEEKDAY_NAMES = {
+    6: 'الأحد',
+    0: 'الاثنين',
+    1: 'الثلاثاء',
+    2: 'الأربعاء',
+    3: 'الخميس',
+}
+
+class PeriodSlot:
+    def __init__(self, number, name=None, start_time=None, end_time=None):
+        self.number = number
+        self.name = name or f'الحصة {number}'
+        self.start_time = start_time
+        self.end_time = end_time
+
+    @property
+    def label(self):
+        if self.start_time and self.end_time:
+            return '{} ({} - {})'.format(self.name, self.start_time.strftime('%H:%M'), self.end_time.strftime('%H:%M'))
+        return self.name
+
+    def to_json(self):
+        return {
+            'number': self.number,
+            'name': self.name,
+            'start': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'end': self.end_time.strftime('%H:%M') if self.end_time else None,
+        }
+
+class TimetableSnapshot:
+    def __init__(self, default, by_weekday):
+        # حصص كل يوم من أيام الأسبوع (0-6) وقناع أرقامها
+        self.days = {weekday: by_weekday.get(weekday, default) for weekday in range(7)}
+        self.masks = {weekday: _mask(slots) for weekday, slots in self.days.items()}
+        self.slots = {weekday: {slot.number: slot for slot in slots} for weekday, slots in self.days.items()}
+
+        # أعمدة الجدول: كل أرقام الحصص في أي يوم، بأسماء وأوقات اليوم العادي إن وجدت
+        columns = {slot.number: slot for slots in by_weekday.values() for slot in slots}
+        columns.update({slot.number: slot for slot in default})
+        self.columns = [columns[number] for number in sorted(columns)]
+
+    def periods_for(self, day):
+        return self.days[day.weekday()]
+
+    def mask_for(self, day):
+        return self.masks[day.weekday()]
+
+    def slot(self, day, number):
+        return self.slots[day.weekday()].get(number)
+
+    def is_valid(self, day, number):
+        return number in self.slots[day.weekday()]
+
+def _mask(slots):
+    mask = 0
+    for slot in slots:
+        mask |= 1 << (slot.number - 1)
+    return mask
+
+def _signature():
+    return tuple(db.session.execute(
+        select(func.count(Period.id), func.max(Period.updated_at))
+    ).one())
+
+def _load():
+    default = []
+    by_weekday = {}
+    for period in Period.query.order_by(Period.number).all():
+        slot = PeriodSlot(period.number, period.name, period.start_time, period.end_time)
+        if period.weekday is None:
+            default.append(slot)
+        else:
+            by_weekday.setdefault(period.weekday, []).append(slot)
+
+    # الأيام التي ليس لها جدول خاص تستخدم جدول اليوم العادي، فلا يترك فارغاً إذا سجل
+    # جدول يوم معين (مثل الخميس) قبل جدول اليوم العادي
+    if not default:
+        default = [PeriodSlot(number) for number in range(1, DEFAULT_PERIOD_COUNT + 1)]
+    return TimetableSnapshot(default, by_weekday)
+
+_timetable = SnapshotCache(_load, 'TIMETABLE_CACHE_TTL', 60, signature=_signature)
+
+def get_timetable():
+    return _timetable.get()
+
+# يستدعى بعد حفظ أي تعديل على الجدول الزمني
+def invalidate_timetable():
+    _timetable.invalidate()
+
+def is_valid_period(day, number):
+    return get_timetable().is_valid(day, number)
+
+def periods_for(day):
+    return get_timetable().periods_for(day)
+
+# خيارات حقل الحصة في النماذج (كل الحصص في أي يوم)
+def period_choices():
+    return [(str(slot.number), slot.label) for slot in get_timetable().columns]